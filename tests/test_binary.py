@@ -0,0 +1,43 @@
+import unittest
+import pathlib
+import tempfile
+from tock import *
+
+examples = pathlib.Path(__file__).parent.parent.joinpath('examples')
+
+class TestBinary(unittest.TestCase):
+    def roundtrip(self, m):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = pathlib.Path(tmp).joinpath('m.tock')
+            write_binary(m, filename)
+            m1 = read_binary(filename)
+        self.assertEqual(m1.store_types, m.store_types)
+        self.assertEqual(m1.state, m.state)
+        self.assertEqual(m1.input, m.input)
+        self.assertEqual(m1.start_config, m.start_config)
+        self.assertEqual(m1.accept_configs, m.accept_configs)
+        self.assertEqual(m1.transitions, m.transitions)
+
+    def test_roundtrip(self):
+        for filename in ['sipser-1-4.csv', 'sipser-2-14.csv', 'sipser-3-7.csv']:
+            self.roundtrip(read_csv(examples.joinpath(filename)))
+
+    def test_mapped(self):
+        m = read_csv(examples.joinpath('sipser-1-4.csv'))
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = pathlib.Path(tmp).joinpath('m.tock')
+            write_binary(m, filename)
+            with MappedMachine(filename) as mm:
+                self.assertEqual(mm.num_transitions, len(m.transitions))
+                self.assertEqual({mm.symbol(i) for i in range(mm.num_symbols)},
+                                 {'q1', 'q2', 'q3', '0', '1', '␣'})
+                # start config: state store has position 0, length 1
+                self.assertEqual(list(mm.data[mm.offsets[0]:mm.offsets[0]+2]), [0, 1])
+                self.assertEqual(mm.symbol(mm.data[mm.offsets[0]+2]), 'q1')
+
+    def test_bad_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = pathlib.Path(tmp).joinpath('m.tock')
+            with open(filename, 'wb') as file:
+                file.write(b'\0' * 64)
+            self.assertRaises(ValueError, lambda: read_binary(filename))
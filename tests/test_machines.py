@@ -29,6 +29,15 @@ class TestStore(unittest.TestCase):
         s.add(Store('a b', 1))
         self.assertEqual(len(s), 3)
 
+    def test_frozen(self):
+        import dataclasses, pickle
+        s = Store('a b', 1)
+        self.assertFalse(hasattr(s, '__dict__'))
+        self.assertRaises(dataclasses.FrozenInstanceError, lambda: setattr(s, 'position', 0))
+        self.assertEqual(hash(s), hash(Store('a b', 1)))
+        self.assertEqual(pickle.loads(pickle.dumps(s)), s)
+        self.assertNotEqual(s, tock.syntax.String('a b'))
+
     def test_sort(self):
         import itertools
         l = [Store('a b', 0), Store('a b', 1), Store('a b c', 0), Store('a b', 1)]
@@ -58,6 +67,10 @@ class TestStore(unittest.TestCase):
         ]:
             self.assertEqual(str(s), ss)
 
+    def test_repr(self):
+        self.assertEqual(repr(Store('q2')), "Store(values=('q2',), position=0)")
+        self.assertEqual(repr(tock.syntax.String('a b')), "String(values=('a', 'b'))")
+
 class TestConfiguration(unittest.TestCase):
     def test_init(self):
         abc, de = Store('a b c'), Store('d e')
@@ -105,6 +118,14 @@ class TestTransition(unittest.TestCase):
         ]:
             self.assertEqual(t1, t2)
 
+    def test_repr(self):
+        self.assertEqual(repr(Configuration('q')), "Configuration(stores=(Store(values=('q',), position=0),))")
+        self.assertEqual(repr(Transition('q -> r')),
+                         "Transition(lhs=Configuration(stores=(Store(values=('q',), position=0),)), "
+                         "rhs=Configuration(stores=(Store(values=('r',), position=0),)))")
+        t = AlignedTransition([Transition('q -> r')])
+        self.assertEqual(repr(t), 'AlignedTransition(lhs={!r}, rhs={!r}, transitions={!r})'.format(t.lhs, t.rhs, t.transitions))
+
     def test_apply(self):
         for pattern, repl, config, result in [
                 ([Store('a a', 1)], 'x y z', [Store('a a', 0)], None),
@@ -141,7 +162,21 @@ class TestAlignedTransition(unittest.TestCase):
         t = AlignedTransition(['a, b -> c', 'd -> e, f'])
         self.assertEqual(t.lhs, Configuration('a, b, d'))
         self.assertEqual(t.rhs, Configuration('c, e, f'))
-                
+        self.assertIs(t.lhs, t.lhs)
+
+    def test_cache(self):
+        m = FiniteAutomaton()
+        m.add_transition('q1, a -> q2')
+        [t1] = m.get_transitions()
+        [t1a] = m.get_transitions()
+        self.assertIs(t1, t1a)
+        m.add_transition('q2, b -> q1')
+        t1b, t2 = m.get_transitions()
+        self.assertIs(t1, t1b)
+        self.assertEqual(t2, AlignedTransition(['q2 -> q1', 'b']))
+        m.transitions = []
+        self.assertEqual(list(m.get_transitions()), [])
+
 class TestMachine(unittest.TestCase):
     def test_fa(self):
         m = FiniteAutomaton()
@@ -211,6 +246,27 @@ class TestMachine(unittest.TestCase):
         self.assertFalse(m.is_pushdown())
         self.assertTrue(m.is_turing())
         self.assertTrue(m.is_deterministic())
-    
+
+    def test_add_transitions(self):
+        m = PushdownAutomaton()
+        m.add_transitions(['q1, a, & -> q2, x',
+                           Transition('q2, b, x -> q2, &'),
+                           ([['q2'], [], ['$']], [['q3'], []])])
+        self.assertEqual(set(m.get_transitions()),
+                         {AlignedTransition(['q1 -> q2', 'a', '& -> x']),
+                          AlignedTransition(['q2 -> q2', 'b', 'x -> &']),
+                          AlignedTransition(['q2 -> q3', '&', '$ -> &'])})
+        # Equal stores are shared
+        self.assertIs(m.transitions[0].rhs[0], m.transitions[1].lhs[0])
+
+        with self.assertRaisesRegex(TypeError, 'Too few things on right-hand side'):
+            m.add_transitions(['q3, a, & -> q4, x', 'q3, a, &'])
+        self.assertEqual(len(m.transitions), 3)
+        with self.assertRaisesRegex(TypeError, "Can't construct Transition from an object of type <class 'int'>"):
+            m.add_transition(42)
+        with self.assertRaisesRegex(TypeError, "Can't construct Transition"):
+            m.add_transitions(['q3, a, & -> q4, x', None])
+        self.assertEqual(len(m.transitions), 3)
+
 if __name__ == '__main__':
     unittest.main()
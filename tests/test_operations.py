@@ -1,6 +1,128 @@
 import unittest
 import tock
 
+class TestAnalysis(unittest.TestCase):
+    def setUp(self):
+        self.m = m = tock.FiniteAutomaton()
+        m.set_start_state('q1')
+        m.add_accept_state('q2')
+        m.add_transitions(['q1, a -> q2', 'q1, a -> q3', 'q3, b -> q3', 'q4, a -> q2'])
+
+    def test_reachable(self):
+        from tock.operations import reachable_states, coreachable_states
+        self.assertEqual(reachable_states(self.m), {'q1', 'q2', 'q3'})
+        self.assertEqual(coreachable_states(self.m), {'q1', 'q2', 'q4'})
+
+    def test_trim(self):
+        mt = tock.operations.trim(self.m)
+        self.assertEqual(mt.states, {'q1', 'q2'})
+        self.assertTrue(tock.equivalent(mt, self.m))
+
+    def test_remove_epsilons(self):
+        m = tock.from_regexp('(a|b)* a (a|&)')
+        mr = tock.operations.remove_epsilons(m)
+        for t in mr.get_transitions():
+            self.assertEqual(len(t.lhs[1]), 1)
+        self.assertTrue(tock.equivalent(mr, m))
+
+class TestAlphabetClasses(unittest.TestCase):
+    def test_classes(self):
+        m = tock.FiniteAutomaton()
+        m.set_start_state('q1')
+        m.add_accept_state('q2')
+        m.add_transitions(['q1, a -> q1', 'q1, b -> q1', 'q1, c -> q1',
+                           'q1, a -> q2', 'q2, b -> q2', 'q2, c -> q2'])
+        self.assertEqual(tock.alphabet_classes(m), [['a'], ['b', 'c']])
+        d = tock.determinize(m)
+        self.assertEqual(len(d.transitions), 6)
+        self.assertEqual(tock.alphabet_classes(d), [['a'], ['b', 'c']])
+        self.assertTrue(tock.equivalent(tock.minimize(m), d))
+
+    def test_input_only(self):
+        # a and b are read identically, although only a is pushed
+        m = tock.PushdownAutomaton()
+        m.set_start_state('q1')
+        m.add_transitions(['q1, a, & -> q1, a', 'q1, b, & -> q1, a'])
+        self.assertEqual(tock.alphabet_classes(m), [['a', 'b']])
+        m.add_transition('q1, a, a -> q1, &')
+        self.assertEqual(tock.alphabet_classes(m), [['a'], ['b']])
+
+class TestDeterminize(unittest.TestCase):
+    def test_determinize(self):
+        m = tock.FiniteAutomaton()
+        m.set_start_state('q1')
+        m.add_accept_state('q3')
+        m.add_transitions(['q1, & -> q2',
+                           'q2, & -> q1', # epsilon cycle
+                           'q2, a -> q3',
+                           'q3, & -> q1',
+                           'q1, b -> q1'])
+        dm = tock.determinize(m)
+        self.assertTrue(dm.is_deterministic())
+        self.assertEqual(dm.get_start_state(), '{q1,q2}')
+        self.assertEqual(dm.get_accept_states(), {'{q1,q2,q3}'})
+        self.assertEqual(dm.states, {'{q1,q2}', '{q1,q2,q3}'})
+        for w in ['&', 'a', 'b a', 'a b', 'a a b a']:
+            self.assertEqual(tock.run(dm, w).has_path(), tock.run(m, w).has_path())
+
+    def test_closures(self):
+        from tock.operations import epsilon_closures
+        self.assertEqual(epsilon_closures([[1], [0, 2], [], [2]]),
+                         [0b111, 0b111, 0b100, 0b1100])
+
+class TestLazyDFA(unittest.TestCase):
+    def test_cache(self):
+        m = tock.from_regexp('(a|b)* a (a|b) (a|b)')
+        d = tock.LazyDFA(m, cache_size=3)
+        for w in ['a a b', 'b a b b', 'a b a b a a', 'b', 'b b b']:
+            self.assertEqual(d.accepts(w), tock.run(m, w).has_path())
+            self.assertLessEqual(len(d.cache), 3)
+
+class TestMinimize(unittest.TestCase):
+    def test_minimize(self):
+        m = tock.from_regexp('(a|b)* a (a|b)')
+        mm = tock.minimize(m)
+        self.assertEqual(len(mm.states), 4)
+        self.assertTrue(tock.equivalent(mm, tock.determinize(m)))
+
+    def test_options(self):
+        m = tock.FiniteAutomaton()
+        m.set_start_state('q1')
+        m.add_transitions(['q1, a -> q2', 'q2, b -> q3', 'q4, b -> q3'])
+        m.add_accept_state('q3')
+        # Already minimal states keep their names
+        self.assertEqual(tock.minimize(m, complete=False).states, {'q1', 'q2', 'q3'})
+        self.assertEqual(len(tock.minimize(m).states), 4)
+        self.assertEqual(tock.minimize(m, complete=False, remove_unreachable=False).states, {'q1', '{q2,q4}', 'q3'})
+
+class TestCount(unittest.TestCase):
+    def test_count(self):
+        m = tock.from_regexp('(a|b)* a (a|b)')
+        self.assertEqual([tock.count_strings(m, n) for n in range(5)], [0, 0, 2, 4, 8])
+        self.assertEqual(tock.count_strings(m, 1000), 2**999)
+
+    def test_sample(self):
+        import random
+        m = tock.from_regexp('(a|b)* a (a|b)')
+        ws = tock.sample_strings(m, 20, k=5, rng=random.Random(1))
+        self.assertEqual(len(ws), 5)
+        for w in ws:
+            self.assertEqual(len(w), 20)
+            self.assertTrue(tock.LazyDFA(m).accepts(w))
+        self.assertRaises(ValueError, lambda: tock.sample_strings(m, 1))
+
+class TestEnumerate(unittest.TestCase):
+    def test_finite(self):
+        m = tock.from_regexp('(a|b)* a b')
+        self.assertEqual([str(w) for w in tock.enumerate_strings(m, 3)],
+                         ['a b', 'a a b', 'b a b'])
+
+    def test_pda(self):
+        g = tock.Grammar.from_lines(['S -> a S b', 'S -> S S', 'S -> &'])
+        m = tock.from_grammar(g)
+        self.assertEqual([str(w) for w in tock.enumerate_strings(m, 4)],
+                         ['ε', 'a b', 'a a b b', 'a b a b'])
+
 class TestEquivalence(unittest.TestCase):
     def test_equivalence(self):
         m1 = tock.determinize(tock.from_regexp("((&|1|1 1) 0 0*)* (&|1|1 1)"))
@@ -8,6 +130,32 @@ class TestEquivalence(unittest.TestCase):
 
         self.assertTrue(tock.equivalent(m1, m2))
 
+    def test_counterexample(self):
+        m1 = tock.from_regexp("(a|b)* a (a|b)")
+        m2 = tock.from_regexp("(a|b)* a b")
+        self.assertIsNone(tock.equivalent(m1, tock.minimize(m1), counterexample=True))
+        self.assertFalse(tock.equivalent(m1, m2))
+        self.assertEqual(tock.equivalent(m1, m2, counterexample=True), tock.syntax.String('a a'))
+
+class TestInclusion(unittest.TestCase):
+    def test_subset(self):
+        m1 = tock.from_regexp('(a b)* a (a|b) (a|b)')
+        m2 = tock.from_regexp('(a|b)* a (a|b) (a|b)')
+        self.assertTrue(tock.is_subset(m1, m2))
+        self.assertIsNone(tock.is_subset(m1, m2, counterexample=True))
+        self.assertFalse(tock.is_subset(m2, m1))
+        w = tock.is_subset(m2, m1, counterexample=True)
+        self.assertTrue(tock.LazyDFA(m2).accepts(w))
+        self.assertFalse(tock.LazyDFA(m1).accepts(w))
+
+    def test_universal(self):
+        self.assertTrue(tock.is_universal(tock.from_regexp('(a|b)* a | (a|b)* b | &')))
+        self.assertFalse(tock.is_universal(tock.from_regexp('(a|b)* a | &')))
+        self.assertEqual(tock.is_universal(tock.from_regexp('(a|b)* a | &'), counterexample=True),
+                         tock.syntax.String('b'))
+        self.assertEqual(tock.is_universal(tock.from_regexp('(a|b)*'), alphabet=['a', 'b', 'c'], counterexample=True),
+                         tock.syntax.String('c'))
+
 class TestIntersection(unittest.TestCase):
     def test_intersection(self):
         m1 = tock.FiniteAutomaton()
@@ -28,3 +176,16 @@ class TestIntersection(unittest.TestCase):
         self.assertEqual(tock.run(m, ['a']*3).has_path(), False)
         self.assertEqual(tock.run(m, ['a']*6).has_path(), True)
 
+    def test_reachable(self):
+        m1 = tock.from_regexp('(a|b)* a')
+        m2 = tock.from_regexp('b (a|b)*')
+        m3 = tock.from_regexp('(a b)*')
+        m = tock.intersect(m1, m2, m3)
+        mt = tock.intersect(m1, m2, m3, trim=True)
+        self.assertLessEqual(len(mt.states), len(m.states))
+        self.assertEqual(len(tock.intersect(m1, tock.from_regexp('b'), trim=True).transitions), 0)
+        d = tock.LazyDFA(tock.intersect(m1, m2))
+        for w in ['b a', 'b b a', 'a b a', 'b a b']:
+            self.assertEqual(d.accepts(w), tock.LazyDFA(m1).accepts(w) and tock.LazyDFA(m2).accepts(w))
+            self.assertFalse(tock.LazyDFA(mt).accepts(w))
+
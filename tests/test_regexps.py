@@ -28,11 +28,263 @@ class TestRegexpParser(unittest.TestCase):
     def test_printer(self):
         for s, r in self.cases:
             self.assertEqual(str(r), s)
+        # Duplicate alternatives are dropped when parsing
+        for s, t in [('a|a', 'a'), ('a|b|a', 'a ∪ b'), ('(a|b)|(b|c)', 'a ∪ b ∪ c')]:
+            self.assertEqual(str(RegularExpression.from_str(s)), t)
+
+    def test_deep(self):
+        import sys
+        n = sys.getrecursionlimit() + 100
+        s = 'a'
+        for i in range(n):
+            s = '(' + s + ' b)*'
+        r = RegularExpression.from_str(s)
+        self.assertEqual(str(r).replace(' ', ''), s.replace(' ', ''))
+        self.assertTrue(r.match('b b'))
+        self.assertFalse(r.match('b a'))
+        self.assertTrue(tock.LazyDFA(from_regexp(r)).accepts('b b'))
+        self.assertIs(r.simplify().simplify(), r.simplify())
+        self.assertTrue(tock.LazyDFA(from_regexp(r, simplify=True)).accepts('b b'))
+        self.assertEqual(repr(r).count("op='star'"), n)
+        import pickle
+        self.assertIs(pickle.loads(pickle.dumps(r)), r)
+
+        # Deep in a different way: nested unions and concatenations
+        p, q = 'a', 'c'
+        for i in range(n):
+            p, q = 'a (b | {})'.format(p), 'a (b | {})'.format(q)
+        r = RegularExpression.from_str('{} | {}'.format(p, q))
+        self.assertIs(r.simplify(), RegularExpression.from_str(p[:-n-1] + '(a | c)' + ')' * n))
+        m = tock.LazyDFA(from_regexp(r, method='antimirov'))
+        self.assertTrue(m.accepts('a ' * n + 'c'))
+        self.assertFalse(m.accepts('a a c'))
+
+    def test_deep_to_regexp(self):
+        import sys
+        n = sys.getrecursionlimit() + 100
+        s = 'a'
+        for i in range(n):
+            s = '(' + s + ' b)*'
+        r = to_regexp(to_dfa(s))
+        self.assertTrue(r.match('b b'))
+        self.assertFalse(r.match('b a'))
 
     def test_unicode(self):
         self.assertEqual(RegularExpression.from_str('&'), RegularExpression.from_str('ε'))
         self.assertEqual(RegularExpression.from_str('a|b'), RegularExpression.from_str('a∪b'))
 
+    def test_hash_consing(self):
+        import pickle
+        r = RegularExpression.from_str('(a|b)* a')
+        self.assertIs(r, RegularExpression.from_str('(a | b)* a'))
+        self.assertEqual(len({r, RegularExpression.from_str('(a|b)* a'), RegularExpression.from_str('a')}), 2)
+        self.assertIs(pickle.loads(pickle.dumps(r)), r)
+        self.assertIs(eval(repr(r), {'RegularExpression': RegularExpression}), r)
+        self.assertNotEqual(RegularExpression.from_str('a b'), RegularExpression.from_str('a b c'))
+        self.assertIs(RegularExpression.from_str('a|b|a'), RegularExpression.from_str('a|b'))
+
+class TestMatch(unittest.TestCase):
+    def test_match(self):
+        r = RegularExpression.from_str('(a|b)* a (a|b)')
+        for w in ['&', 'a', 'a a', 'b a b', 'a b b', 'b b a a b a b']:
+            self.assertEqual(r.match(w), tock.run(from_regexp(r), w).has_path())
+        self.assertFalse(RegularExpression.from_str('∅').match('&'))
+        self.assertTrue(RegularExpression.from_str('(a* b*)*').match('&'))
+
+    def test_derivative(self):
+        r = RegularExpression.from_str('(a|b)* a (a|b)')
+        # ACI normalization keeps the number of repeated derivatives finite
+        states = {r}
+        frontier = [r]
+        while frontier:
+            e = frontier.pop()
+            for a in ['a', 'b']:
+                d = e.derivative(a)
+                if d not in states:
+                    states.add(d)
+                    frontier.append(d)
+        self.assertEqual(len(states), 4)
+
+    def test_derivative_order(self):
+        # How a derivative prints does not depend on which
+        # subexpressions happened to be created first
+        e = '(a{0}|b{0})* a{0} (b{0}|a{0}) | b{0} (a{0}|b{0})* a{0}'
+        # (kept alive, because the intern table only holds weak references)
+        earlier = [RegularExpression.from_str('b1 a1'), RegularExpression.from_str('a2 b2')]
+        d1 = RegularExpression.from_str(e.format(1)).derivative('a1')
+        d2 = RegularExpression.from_str(e.format(2)).derivative('a2')
+        self.assertEqual(str(d1), str(d2).replace('2', '1'))
+        self.assertEqual(sorted([d2, d1, RegularExpression.from_str('a1')]),
+                         sorted([RegularExpression.from_str('a1'), d1, d2]))
+
+class TestSimplify(unittest.TestCase):
+    def test_rules(self):
+        for s, t in [
+                ('a | a', 'a'),
+                ('∅*', '&'),
+                ('&*', '&'),
+                ('(& | a)*', 'a*'),
+                ('(a* b*)*', '(a|b)*'),
+                ('a* a*', 'a*'),
+                ('& | a b (a b)*', '(a b)*'),
+                ('a b | a c', 'a (b|c)'),
+                ('b a | c a', '(b|c) a'),
+                ('(a b)* | a b', '(a b)*'),
+                ('a (& | b b*) c | a c', 'a b* c'),
+        ]:
+            r = RegularExpression.from_str(s).simplify()
+            self.assertIs(r, RegularExpression.from_str(t))
+            self.assertIs(r.simplify(), r)
+            self.assertTrue(tock.equivalent(from_regexp(s), from_regexp(r)))
+
+    def test_unsimplified(self):
+        # Expressions built without the smart constructors
+        from tock.regexps import symbol, EMPTYSET, EPSILON
+        a = symbol('a')
+        for args, t in [
+                ((a, EMPTYSET), '∅'),
+                ((a, RegularExpression('union', (EMPTYSET, EMPTYSET))), '∅'),
+                ((a, EPSILON), 'a'),
+        ]:
+            r = RegularExpression('concatenation', args).simplify()
+            self.assertIs(r, RegularExpression.from_str(t))
+
+    def test_long_prefix(self):
+        import sys
+        n = sys.getrecursionlimit() + 100
+        a = ' '.join(['a'] * n)
+        r = RegularExpression.from_str('{0} b | {0} c'.format(a)).simplify()
+        self.assertIs(r, RegularExpression.from_str('{} (b | c)'.format(a)))
+        r = RegularExpression.from_str('b {0} | c {0}'.format(a)).simplify()
+        self.assertIs(r, RegularExpression.from_str('(b | c) {}'.format(a)))
+        # Nested common prefixes
+        r = RegularExpression.from_str(' | '.join('a ' * i + 'b' for i in range(50))).simplify()
+        self.assertIs(r, r.simplify())
+        self.assertTrue(r.match('a ' * 49 + 'b'))
+        self.assertFalse(r.match('a ' * 50 + 'b'))
+
+    def test_from_regexp(self):
+        e = '(a* | b a*)* (a | a)'
+        self.assertLess(len(from_regexp(e, simplify=True).states), len(from_regexp(e).states))
+        self.assertTrue(tock.equivalent(from_regexp(e, simplify=True), from_regexp(e)))
+
+class TestEquivalence(unittest.TestCase):
+    def test_equivalent(self):
+        from tock.regexps import equivalent
+        self.assertTrue(equivalent('((&|1|1 1) 0 0*)* (&|1|1 1)', '(0|1(0|1 0))*(&|1(1|&))'))
+        self.assertTrue(equivalent('(a* b*)*', '(a|b)*'))
+        self.assertIsNone(equivalent('(b* a)* b* a', '(a|b)* a', counterexample=True))
+        self.assertFalse(equivalent('(a|b)* a (a|b)', '(a|b)* a b'))
+        self.assertEqual(equivalent('(a|b)* a (a|b)', '(a|b)* a b', counterexample=True),
+                         tock.syntax.String('a a'))
+        self.assertEqual(equivalent('a*', '∅', counterexample=True), tock.syntax.String('&'))
+
+class TestSearch(unittest.TestCase):
+    def test_search(self):
+        r = RegularExpression.from_str('a (b|c)* a')
+        self.assertEqual(list(r.search('a b a c a d a')), [(0, 3), (2, 5)])
+        self.assertEqual(list(r.search(iter('d a a b a'.split()))), [(1, 3), (2, 5)])
+        self.assertEqual(list(RegularExpression.from_str('b*').search('a b')), [(0, 0), (1, 1), (1, 2)])
+
+    def test_brute_force(self):
+        r = RegularExpression.from_str('(a b | b)* a')
+        w = 'b a b a a b b a'.split()
+        expected = []
+        for j in range(len(w)+1):
+            for i in range(j):
+                if r.match(w[i:j]):
+                    expected.append((i, j))
+                    break
+        self.assertEqual(list(r.search(w)), expected)
+
+    def test_all_starts(self):
+        w = 'b a b a a b b a'.split()
+        for e in ['(a b | b)* a', 'a* | b', '(a|b)*', 'a b a', '∅']:
+            r = RegularExpression.from_str(e)
+            expected = [(i, j) for j in range(len(w)+1) for i in range(j+1)
+                        if r.match(w[i:j] if i < j else '&')]
+            self.assertEqual(list(r.search(w, all_starts=True)), expected)
+            # By default, only the leftmost start for each end
+            leftmost = [(i, j) for (i, j) in expected if (i, j) == min(p for p in expected if p[1] == j)]
+            self.assertEqual(list(r.search(w)), leftmost)
+
+class TestScanner(unittest.TestCase):
+    def test_matches(self):
+        patterns = ['(a|b)* a (a|b)', '(a|b)* a b', 'b*']
+        s = compile_many(patterns)
+        for w in ['&', 'a', 'a b', 'b a a', 'b b a b']:
+            self.assertEqual(s.matches(w), [i for i, e in enumerate(patterns) if tock.LazyDFA(from_regexp(e)).accepts(w)])
+
+    def test_tokenize(self):
+        s = compile_many(['i f', '(a|b|i|f) (a|b|i|f)*', '0 | 1 (0|1)*', '_'])
+        self.assertEqual([(i, str(t)) for i, t in s.tokenize('i f _ i f f _ 1 0 _ 0 1')],
+                         [(0, 'i f'), (3, '␣'), (1, 'i f f'), (3, '␣'), (2, '1 0'), (3, '␣'), (2, '0'), (2, '1')])
+        self.assertRaises(ValueError, lambda: list(s.tokenize('a b c')))
+
+class TestFromRegexp(unittest.TestCase):
+    def test_glushkov(self):
+        for e in ['(a|b)* a (a|b)', '(a* b*)* | &', 'a (b | &) (c d)*', '∅', '&']:
+            m = from_regexp(e, method='glushkov')
+            self.assertTrue(tock.equivalent(m, from_regexp(e)))
+            for t in m.get_transitions():
+                self.assertEqual(len(t.lhs[1]), 1)
+        m = from_regexp('(a|b)* a (a|b)', method='glushkov')
+        self.assertEqual(m.states, {'0', '1', '2', '3', '4', '5'})
+        self.assertRaises(ValueError, lambda: from_regexp('a', method='brzozowski'))
+
+    def test_antimirov(self):
+        for e in ['(a|b)* a (a|b)', '(a* b*)* | &', 'a (b | &) (c d)*', '∅', '&']:
+            m = from_regexp(e, method='antimirov')
+            self.assertTrue(tock.equivalent(m, from_regexp(e)))
+            for t in m.get_transitions():
+                self.assertEqual(len(t.lhs[1]), 1)
+        self.assertEqual(len(from_regexp('(a|b)* a (a|b)', method='antimirov').states), 3)
+
+    def test_antimirov_order(self):
+        # The numbering of states does not depend on which
+        # subexpressions happened to be created first
+        def transitions(i):
+            m = from_regexp('a x_{0} x_{0} | a y_{0} y_{0}'.format(i), method='antimirov')
+            return sorted(str(t).replace('_{}'.format(i), '') for t in m.get_transitions())
+        # (kept alive, because the intern table only holds weak references)
+        earlier = [RegularExpression.from_str('y_1 y_1'), RegularExpression.from_str('x_1 x_1'),
+                   RegularExpression.from_str('x_2 x_2'), RegularExpression.from_str('y_2 y_2')]
+        self.assertEqual(transitions(1), transitions(2))
+
+    def test_antimirov_deep(self):
+        # Two partial derivatives that differ only at the bottom
+        import sys
+        n = sys.getrecursionlimit() + 100
+        p, q = 'x', 'z'
+        for i in range(n):
+            p, q = 'x (y | {})'.format(p), 'x (y | {})'.format(q)
+        m = from_regexp('a {} | a {}'.format(p, q), method='antimirov')
+        self.assertEqual(len(m.states), 2*n+4)
+        self.assertTrue(tock.run(m, 'a x x y').has_path())
+        self.assertFalse(tock.run(m, 'a x y y').has_path())
+
+    def test_to_dfa(self):
+        for e in ['(a|b)* a (a|b)', '(a* b*)* | &', 'a (b | &) (c d)*', '∅', '&']:
+            m = to_dfa(e)
+            self.assertTrue(m.is_deterministic())
+            self.assertTrue(tock.equivalent(m, from_regexp(e)))
+        self.assertEqual(to_dfa('(a|b)* a b').states, {'{0}', '{1,3}', '{2,4}', '{2}'})
+        d = to_dfa('(a|b)* a b', lazy=True)
+        self.assertTrue(d.accepts('b a b'))
+        self.assertFalse(d.accepts('b a'))
+
+class TestToRegexp(unittest.TestCase):
+    def test_to_regexp(self):
+        for e in ['(a|b)* a (a|b)', '(a* b*)* | &', 'a (b | &) (c d)*', '∅', '&']:
+            m = tock.minimize(from_regexp(e))
+            self.assertTrue(tock.equivalent(from_regexp(to_regexp(m)), m))
+
+    def test_size(self):
+        m = tock.minimize(from_regexp('(a|b)* a (a|b) (a|b) (a|b)'), complete=False)
+        r = to_regexp(m)
+        self.assertTrue(tock.equivalent(from_regexp(r), m))
+        self.assertLess(len(str(r)), 10000)
+
 if __name__ == '__main__':
     unittest.main()
 
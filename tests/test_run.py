@@ -24,3 +24,28 @@ class TestRun(unittest.TestCase):
 
         path = run(m, 'a').shortest_path()
         self.assertEqual(len(path), 2)
+
+    def test_intern(self):
+        m = TuringMachine()
+        m.set_start_state('q1')
+        m.add_accept_state('q2')
+        m.add_transition('q1, a -> q1, b, R')
+        m.add_transition('q1, a -> q1, a, R')
+        m.add_transition('q1, _ -> q2, _, S')
+
+        r1 = run(m, 'a a')
+        r2 = run(m, 'a a', intern=True)
+        self.assertEqual(r1.nodes, r2.nodes)
+        states = {id(q[0]) for q in r2.nodes}
+        self.assertEqual(len(states), 2)
+
+    def test_lazy_dfa(self):
+        m = FiniteAutomaton()
+        m.set_start_state('q1')
+        m.add_accept_state('q3')
+        m.add_transitions(['q1, a -> q1', 'q1, b -> q1', 'q1, a -> q2', 'q2, b -> q3'])
+        r = run_lazy_dfa(m, 'a a b')
+        self.assertTrue(r.has_path())
+        self.assertEqual([str(c) for c in r.shortest_path()],
+                         ['{q1},[a] a b', '{q1,q2},[a] b', '{q1,q2},b', '{q1,q3},ε'])
+        self.assertFalse(run_lazy_dfa(m, 'a b a').has_path())
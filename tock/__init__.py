@@ -3,5 +3,6 @@ from .operations import *
 from .runs import *
 from .tables import *
 from .graphs import *
+from .binary import *
 from .regexps import *
 from .grammars import *
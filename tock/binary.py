@@ -0,0 +1,212 @@
+"""This module reads and writes Machines in a compact binary format.
+
+A file consists of a header, a table of all the symbols used by the
+machine (including states), and an array of integers encoding the
+start configuration, the accept configurations, and the transitions,
+in which every symbol is replaced by its index in the symbol table.
+Because nothing needs to be lexed, reading is much faster than
+`read_csv` or `read_tgf`, and `MappedMachine` can access the integer
+arrays of a memory-mapped file without converting them to Python
+objects at all.
+"""
+
+import array
+import mmap
+import struct
+import sys
+from . import machines
+from . import syntax
+
+__all__ = ['read_binary', 'write_binary', 'MappedMachine']
+
+MAGIC = b'TOCK'
+VERSION = 1
+
+# magic, version, num_stores, state, input, num_symbols, symbol bytes,
+# has start config, number of accept configs, number of transitions
+header = struct.Struct('<4sIIiiIIIII')
+
+store_type_codes = {machines.BASE: 0, machines.STREAM: 1, machines.TAPE: 2}
+store_type_names = {code: st for st, code in store_type_codes.items()}
+
+def pad4(n):
+    return (n + 3) // 4 * 4
+
+def write_binary(m, filename):
+    """Writes `Machine` `m` to file named by `filename` in binary format.
+
+    Each configuration is encoded as a sequence of stores, and each
+    store as its head position, its length, and its symbols. A
+    transition is encoded as its left-hand side followed by its
+    right-hand side.
+    """
+    symbols = {}
+    def symbol_id(x):
+        if x not in symbols:
+            symbols[x] = len(symbols)
+        return symbols[x]
+
+    data = array.array('i')
+    offsets = array.array('I', [0])
+    def add_config(config):
+        for store in config:
+            data.append(store.position)
+            data.append(len(store))
+            data.extend(symbol_id(x) for x in store.values)
+
+    has_start = m.start_config is not None
+    if has_start:
+        add_config(m.start_config)
+        offsets.append(len(data))
+    accept_configs = sorted(m.accept_configs)
+    for config in accept_configs:
+        add_config(config)
+        offsets.append(len(data))
+    for t in m.transitions:
+        add_config(t.lhs)
+        add_config(t.rhs)
+        offsets.append(len(data))
+
+    blob = bytearray()
+    symbol_offsets = array.array('I', [0])
+    for x in symbols:
+        blob.extend(str(x).encode('utf8'))
+        symbol_offsets.append(len(blob))
+
+    if sys.byteorder != 'little':
+        for a in [data, offsets, symbol_offsets]:
+            a.byteswap()
+
+    with open(filename, 'wb') as file:
+        file.write(header.pack(MAGIC, VERSION, m.num_stores,
+                               -1 if m.state is None else m.state,
+                               -1 if m.input is None else m.input,
+                               len(symbols), len(blob),
+                               int(has_start), len(accept_configs), len(m.transitions)))
+        types = bytes(store_type_codes[st] for st in m.store_types)
+        file.write(types + bytes(pad4(len(types))-len(types)))
+        file.write(symbol_offsets.tobytes())
+        file.write(bytes(blob) + bytes(pad4(len(blob))-len(blob)))
+        file.write(offsets.tobytes())
+        file.write(data.tobytes())
+
+class MappedMachine:
+    """A Machine stored in a binary file (see `write_binary`), which is
+    memory-mapped rather than read into memory.
+
+    Arguments:
+        filename (str): name of file to open
+
+    The integer arrays are available as `memoryview`s, so that code
+    that works with integer-coded automata can use them directly:
+
+    - `offsets[i]` to `offsets[i+1]` is the range of `data` for item
+      `i`, where the items are the start configuration (if there is
+      one), then the accept configurations, then the transitions.
+    - Symbol number `i` can be looked up using `symbol(i)`.
+    """
+    def __init__(self, filename):
+        with open(filename, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < header.size or self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{filename} is not a Tock binary file")
+        self._buf = buf = memoryview(self._mmap)
+        (magic, version, num_stores, state, input,
+         num_symbols, blob_len, has_start, num_accept, num_transitions) = header.unpack_from(buf)
+        if version != VERSION:
+            buf.release()
+            self._mmap.close()
+            raise ValueError(f"{filename} has unsupported version {version}")
+        pos = header.size
+
+        self.store_types = tuple(store_type_names[code] for code in buf[pos:pos+num_stores])
+        self.state = None if state == -1 else state
+        self.input = None if input == -1 else input
+        self.has_start = bool(has_start)
+        self.num_accept = num_accept
+        self.num_transitions = num_transitions
+        pos += pad4(num_stores)
+
+        def ints(n, fmt):
+            nonlocal pos
+            view = buf[pos:pos+4*n]
+            pos += 4*n
+            if sys.byteorder == 'little':
+                return view.cast(fmt)
+            else:
+                a = array.array(fmt, view.tobytes())
+                a.byteswap()
+                return memoryview(a)
+
+        self._symbol_offsets = ints(num_symbols+1, 'I')
+        self._blob = buf[pos:pos+blob_len]
+        pos += pad4(blob_len)
+        self.offsets = ints(int(has_start) + num_accept + num_transitions + 1, 'I')
+        self.data = ints(self.offsets[-1], 'i')
+        self._symbols = [None] * num_symbols
+
+    @property
+    def num_symbols(self):
+        return len(self._symbols)
+
+    def symbol(self, i):
+        """Return symbol number `i`."""
+        x = self._symbols[i]
+        if x is None:
+            start, end = self._symbol_offsets[i], self._symbol_offsets[i+1]
+            x = self._symbols[i] = syntax.Symbol(str(self._blob[start:end], 'utf8'))
+        return x
+
+    def close(self):
+        """Release the memory-mapped file."""
+        for view in [self._symbol_offsets, self._blob, self.offsets, self.data, self._buf]:
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+    def to_machine(self):
+        """Convert to a `Machine`."""
+        m = machines.Machine(self.store_types, state=self.state, input=self.input)
+
+        data = self.data
+        stores = {}
+        configs = {}
+        def read_config(i):
+            store_list = []
+            for _ in range(m.num_stores):
+                position, n = data[i], data[i+1]
+                key = (position, bytes(data[i+2:i+2+n]))
+                if key not in stores:
+                    values = tuple(self.symbol(x) for x in data[i+2:i+2+n])
+                    stores[key] = machines.Store(values, position)
+                store_list.append(stores[key])
+                i += 2+n
+            store_list = tuple(store_list)
+            if store_list not in configs:
+                configs[store_list] = machines.Configuration(store_list)
+            return configs[store_list], i
+
+        item = 0
+        if self.has_start:
+            m.start_config, _ = read_config(self.offsets[item])
+            item += 1
+        for _ in range(self.num_accept):
+            config, _ = read_config(self.offsets[item])
+            m.accept_configs.add(config)
+            item += 1
+        for _ in range(self.num_transitions):
+            lhs, i = read_config(self.offsets[item])
+            rhs, _ = read_config(i)
+            m.transitions.append(machines.Transition(lhs, rhs))
+            item += 1
+        return m
+
+def read_binary(filename):
+    """Reads a `Machine` from a file written by `write_binary`."""
+    with MappedMachine(filename) as mm:
+        return mm.to_machine()
@@ -501,6 +501,7 @@ def intersect_stack(p, m):
     pm.set_start_state(pq0)
     pm.add_transition([[pq0], [], []], [[pq1], [m.get_start_state()]])
 
+    transitions = []
     for pt in p.get_transitions():
         [[pq], pa, px], [[pr], py] = pt.lhs, pt.rhs
         for mq in m.states:
@@ -512,7 +513,8 @@ def intersect_stack(p, m):
                 pmy += [y, m_bystate[pmy[-1], y]]
 
             if pmx[-1] in mf and pmy[-1] in mf:
-                pm.add_transition([[pq], pa, reversed(pmx)], [[pr], reversed(pmy)])
+                transitions.append(([[pq], pa, reversed(pmx)], [[pr], reversed(pmy)]))
+    pm.add_transitions(transitions)
                     
     pm.add_accept_states(p.get_accept_states())
     return pm
@@ -528,9 +530,11 @@ def renumber_states(m, verbose=False):
     mr = machines.FiniteAutomaton()
     mr.set_start_state(index[m.get_start_state()])
     mr.add_accept_states([index[q] for q in m.get_accept_states()])
+    transitions = []
     for t in m.get_transitions():
         [[q], [a]], [[r]] = t.lhs, t.rhs
-        mr.add_transition([[index[q]], [a]], [[index[r]]])
+        transitions.append(([[index[q]], [a]], [[index[r]]]))
+    mr.add_transitions(transitions)
     return mr
 
 def lr_automaton(g, k=0):
@@ -563,8 +567,9 @@ def lr_automaton(g, k=0):
 
     # Nonstandardly read a $ because from_cfg_bottomup pushes a $ at
     # the bottom of its stack.
-    m.add_transition(['start', '$'],
-                     [[DottedRule(None, [g.start_nonterminal] + [END]*k, 0, 1)]])
+    transitions = []
+    transitions.append((['start', '$'],
+                        [[DottedRule(None, [g.start_nonterminal] + [END]*k, 0, 1)]]))
 
     for lhs in g_bylhs:
         for rhs in g_bylhs[lhs]:
@@ -577,7 +582,7 @@ def lr_automaton(g, k=0):
                 dr = DottedRule(lhs, list(rhs)+look, 0, len(rhs))
                 for i, x in enumerate(dr.rhs):
                     # Shift
-                    m.add_transition([[dr.move(i)], [x]], [[dr.move(i+1)]])
+                    transitions.append(([[dr.move(i)], [x]], [[dr.move(i+1)]]))
                     # Predict
                     if x not in g.nonterminals:
                         continue
@@ -590,9 +595,10 @@ def lr_automaton(g, k=0):
                             looks1 += looks
                     for rhs1 in g_bylhs[x]:
                         for look1 in looks1:
-                            m.add_transition([[dr.move(i)], []],
-                                             [[DottedRule(x, list(rhs1)+look1, 0, len(rhs1))]])
+                            transitions.append(([[dr.move(i)], []],
+                                                [[DottedRule(x, list(rhs1)+look1, 0, len(rhs1))]]))
                 m.add_accept_state(dr.move(len(dr.rhs)))
+    m.add_transitions(transitions)
                 
     return m
 
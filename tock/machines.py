@@ -3,14 +3,13 @@ and associated classes and functions."""
 
 import collections
 import itertools
-import dataclasses
+import weakref
 from . import syntax, settings
 
 __all__ = ['Machine',
            'FiniteAutomaton', 'PushdownAutomaton', 'TuringMachine',
            'BASE', 'STREAM', 'TAPE']
 
-@dataclasses.dataclass(frozen=True, order=True)
 class Store(syntax.String):
     """A string together with a head position. It is used either as a
     store of a Machine or as a pattern to be matched against a store of a
@@ -22,7 +21,7 @@ class Store(syntax.String):
         store (Store or str): Another Store to copy, or a str to convert to a Store
     """
 
-    position: int #: The head position
+    __slots__ = {'position': 'The head position'}
 
     def __init__(self, *args):
         default_position = 0
@@ -50,6 +49,9 @@ class Store(syntax.String):
         object.__setattr__(self, 'position',
                            position if position is not None else default_position)
 
+    def _key(self):
+        return (self.values, self.position)
+
     def __str__(self):
         if len(self) == 0:
             if self.position in [0, None]:
@@ -95,8 +97,7 @@ class Store(syntax.String):
             return False
         return True
     
-@dataclasses.dataclass(frozen=True, order=True)
-class Configuration:
+class Configuration(syntax.Frozen):
     """A configuration, which is essentially a tuple of `Stores`.
 
     Arguments:
@@ -104,7 +105,7 @@ class Configuration:
         config (Configuration or str): Another Configuration to copy, or a str to convert to a Configuration
     """
     
-    stores: tuple #: A tuple of Stores
+    __slots__ = {'stores': 'A tuple of Stores'}
     
     def __init__(self, arg):
         if isinstance(arg, Configuration):
@@ -117,6 +118,9 @@ class Configuration:
             raise TypeError("Can't construct Configuration from {}".format(type(arg)))
         object.__setattr__(self, 'stores', stores)
 
+    def _key(self):
+        return (self.stores,)
+
     def __str__(self):
         return ','.join(map(str, self.stores))
     def _repr_html_(self):
@@ -139,8 +143,7 @@ class Configuration:
                 return False
         return True
 
-@dataclasses.dataclass(frozen=True, order=True)
-class Transition:
+class Transition(syntax.Frozen):
     """A transition from one `Configuration` to another `Configuration`.
 
     Arguments:
@@ -149,8 +152,8 @@ class Transition:
         transition (Transition or str): Another Transition to copy, or a str to convert to a Transition
     """
 
-    lhs: Configuration #: left-hand side Configuration
-    rhs: Configuration #: right-hand side Configuration
+    __slots__ = {'lhs': 'left-hand side Configuration',
+                 'rhs': 'right-hand side Configuration'}
     
     def __init__(self, *args):
         if len(args) == 1:
@@ -173,6 +176,9 @@ class Transition:
         object.__setattr__(self, 'lhs', lhs)
         object.__setattr__(self, 'rhs', rhs)
 
+    def _key(self):
+        return (self.lhs, self.rhs)
+
     def match(self, config):
         """Returns True iff self can be applied to config."""
         return self.lhs.match(config)
@@ -220,7 +226,6 @@ class Transition:
         else:
             return self.lhs._repr_html_()
 
-@dataclasses.dataclass(frozen=True, order=True)
 class AlignedTransition(Transition):
     """A `Transition` that has an alignment between the lhs and rhs. These
     are generated by `get_transitions` so that even if the number of
@@ -231,21 +236,38 @@ class AlignedTransition(Transition):
     containing the lhs and rhs just for store number `i`.
     """
 
-    transitions: tuple
+    __slots__ = ('transitions', '_lhs', '_rhs')
     
     def __init__(self, transitions):
-        object.__setattr__(self, 'transitions', tuple(Transition(t) for t in transitions))
+        object.__setattr__(self, 'transitions',
+                           tuple(t if type(t) is Transition else Transition(t) for t in transitions))
+
+    def _key(self):
+        return (self.lhs, self.rhs, self.transitions)
+    def _args(self):
+        return (self.transitions,)
 
     @staticmethod
     def _flatten(lol):
         return list(itertools.chain(*lol))
 
+    # lhs and rhs are computed on first access and then cached.
     @property
     def lhs(self):
-        return Configuration(self._flatten([t.lhs for t in self.transitions]))
+        try:
+            return self._lhs
+        except AttributeError:
+            lhs = Configuration(self._flatten([t.lhs for t in self.transitions]))
+            object.__setattr__(self, '_lhs', lhs)
+            return lhs
     @property
     def rhs(self):
-        return Configuration(self._flatten([t.rhs for t in self.transitions]))
+        try:
+            return self._rhs
+        except AttributeError:
+            rhs = Configuration(self._flatten([t.rhs for t in self.transitions]))
+            object.__setattr__(self, '_rhs', rhs)
+            return rhs
 
     def __len__(self):
         return len(self.transitions)
@@ -257,6 +279,61 @@ class AlignedTransition(Transition):
     def __add__(self, other):
         return AlignedTransition(self.transitions+other.transitions)
 
+class Interner:
+    """Hash-consing tables that map equal Symbols, Stores, and
+    Configurations to a single shared object. This saves memory when
+    the same stores occur in many configurations, and equality tests
+    between shared objects succeed immediately.
+
+    The tables only hold weak references, so an object is dropped from
+    its table once nothing else refers to it.
+
+    Calling an `Interner` on a Symbol, Store, or Configuration returns
+    the shared object equal to it.
+    """
+    def __init__(self):
+        self.symbols = weakref.WeakValueDictionary()
+        self.stores = weakref.WeakValueDictionary()
+        self.configs = weakref.WeakValueDictionary()
+
+    def __call__(self, x):
+        if isinstance(x, Configuration):
+            return self.config(x)
+        elif isinstance(x, Store):
+            return self.store(x)
+        elif isinstance(x, syntax.Symbol):
+            return self.symbol(x)
+        else:
+            raise TypeError(f"can't intern object of type {type(x)}")
+
+    def symbol(self, x):
+        key = str(x)
+        try:
+            return self.symbols[key]
+        except KeyError:
+            self.symbols[key] = x
+            return x
+
+    def store(self, s):
+        try:
+            return self.stores[s.values, s.position]
+        except KeyError:
+            values = tuple(map(self.symbol, s.values))
+            if any(x is not y for x, y in zip(values, s.values)):
+                s = Store(values, s.position)
+            self.stores[s.values, s.position] = s
+            return s
+
+    def config(self, c):
+        stores = tuple(map(self.store, c.stores))
+        try:
+            return self.configs[stores]
+        except KeyError:
+            if any(x is not y for x, y in zip(stores, c.stores)):
+                c = Configuration(stores)
+            self.configs[c.stores] = c
+            return c
+
 # Store types.
     
 BASE = "BASE"
@@ -305,6 +382,11 @@ class Machine:
         self.start_config = None              #: The start configuration
         self.accept_configs = set()           #: Set of accept configurations
 
+        # Cache for get_transitions, valid as long as store_types and
+        # transitions are the same as in _aligned_version
+        self._aligned_version = None
+        self._aligned = []
+
     @property
     def num_stores(self):
         """How many stores the Machine has."""
@@ -366,73 +448,129 @@ class Machine:
         return (set(t.lhs[self.state][0] for t in self.transitions) | 
                 set(t.rhs[self.state][0] for t in self.transitions))
 
-    def add_transition(self, *args):
-        """Add a transition. The argument can either be a `Transition` or a
-        left-hand side and a right-hand side.
-
-        - If a store is a STREAM, there should not be an rhs; an empty
-          rhs is automatically inserted.
-        - If a store is a TAPE, there should be two rhs's: a write
-          (whose position is ignored) and a move (L or R).
-        """
-        if len(args) == 1 and isinstance(args[0], Transition):
-            t = args[0]
-        else:
-            t = Transition(*args)
-
-        lhs = []
-        rhs = []
+    def _transition_layout(self):
+        """Returns a list with, for each store, its type and the indices
+        of its lhs and rhs in a transition as passed to
+        `add_transition`, together with the total size of the lhs and
+        rhs."""
+        layout = []
         li = ri = 0
-        for si, st in enumerate(self.store_types):
+        for st in self.store_types:
             if st == BASE:
-                if li >= len(t.lhs):
-                    raise TypeError("Too few things on left-hand side of arrow")
-                if ri >= len(t.rhs):
-                    raise TypeError("Too few things on right-hand side of arrow")
-                lhs.append(t.lhs[li])
-                rhs.append(t.rhs[ri])
+                layout.append((st, li, ri))
                 li += 1
                 ri += 1
             elif st == STREAM:
-                if li >= len(t.lhs):
-                    raise TypeError("Too few things on left-hand side of arrow")
-                lhs.append(t.lhs[li])
+                layout.append((st, li, None))
                 li += 1
-                rhs.append(Store())
             elif st == TAPE:
-                if li >= len(t.lhs):
-                    raise TypeError("Too few things on left-hand side of arrow")
-                if ri+1 >= len(t.rhs):
-                    raise TypeError("Too few things on right-hand side of arrow")
-                lhs.append(t.lhs[li])
-                b, [d] = t.rhs[ri:ri+2]
-                if d == 'L':
-                    p = -1
-                elif d == 'S':
-                    p = 0
-                elif d == 'R':
-                    p = len(b)
-                else:
-                    raise ValueError('Invalid move {} (allowed moves are L, S, and R)'.format(repr(d)))
-                rhs.append(Store(b, p))
+                layout.append((st, li, ri))
                 li += 1
                 ri += 2
             else:
                 assert False
+        return layout, li, ri
 
-        if li < len(t.lhs):
-            raise TypeError("Too many things on left-hand side of arrow")
-        if ri < len(t.rhs):
-            raise TypeError("Too many things on right-hand side of arrow")
-        if len(lhs) != len(rhs):
-            raise TypeError("Left-hand side and right-hand side must have same number of stores")
+    def add_transition(self, *args):
+        """Add a transition. The argument can either be a `Transition` or a
+        left-hand side and a right-hand side.
 
-        self.transitions.append(Transition(lhs, rhs))
+        - If a store is a STREAM, there should not be an rhs; an empty
+          rhs is automatically inserted.
+        - If a store is a TAPE, there should be two rhs's: a write
+          (whose position is ignored) and a move (L or R).
+        """
+        if len(args) == 1:
+            self.add_transitions(args)
+        elif len(args) == 2:
+            self.add_transitions([args])
+        else:
+            raise TypeError("Invalid arguments to Transition")
 
     def add_transitions(self, transitions):
-        """Add a list of transitions (see `add_transition`)."""
+        """Add a list of transitions (see `add_transition`). Each
+        transition can be a `Transition`, a `str`, or a pair of a
+        left-hand side and a right-hand side.
+
+        This is much faster than calling `add_transition` repeatedly,
+        because the store types are only examined once, and equal
+        Stores are shared by all the new transitions. If any
+        transition is invalid, none of them are added.
+        """
+        layout, lhs_size, rhs_size = self._transition_layout()
+
+        stores = {}
+        def share(s):
+            return stores.setdefault(s, s)
+        # Cache conversions from strs and sequences of strs, for which
+        # equal arguments always yield equal Stores
+        converted = {}
+        def make_store(x):
+            if isinstance(x, Store):
+                return share(x)
+            elif isinstance(x, str):
+                key = x
+            elif isinstance(x, (list, tuple)) and all(isinstance(y, str) for y in x):
+                key = tuple(x)
+            else:
+                return share(Store(x))
+            if key not in converted:
+                converted[key] = share(Store(x))
+            return converted[key]
+        def make_stores(x):
+            if isinstance(x, Configuration):
+                return tuple(map(share, x.stores))
+            elif isinstance(x, str):
+                return tuple(map(share, syntax.str_to_config(x).stores))
+            else:
+                return tuple(map(make_store, x))
+
+        def size_error(lhs, rhs):
+            for st, li, ri in layout:
+                if li >= len(lhs):
+                    raise TypeError("Too few things on left-hand side of arrow")
+                if (st == BASE and ri >= len(rhs) or
+                    st == TAPE and ri+1 >= len(rhs)):
+                    raise TypeError("Too few things on right-hand side of arrow")
+            if len(lhs) > lhs_size:
+                raise TypeError("Too many things on left-hand side of arrow")
+            raise TypeError("Too many things on right-hand side of arrow")
+
+        empty = share(Store())
+        new = []
         for t in transitions:
-            self.add_transition(t)
+            if isinstance(t, str):
+                t = syntax.str_to_transition(t)
+            if isinstance(t, Transition):
+                lhs, rhs = make_stores(t.lhs), make_stores(t.rhs)
+            elif isinstance(t, (list, tuple)) and len(t) == 2:
+                lhs, rhs = t
+                lhs, rhs = make_stores(lhs), make_stores(rhs)
+            else:
+                raise TypeError(f"Can't construct Transition from an object of type {type(t)}")
+            if len(lhs) != lhs_size or len(rhs) != rhs_size:
+                size_error(lhs, rhs)
+
+            trhs = []
+            for st, li, ri in layout:
+                if st == BASE:
+                    trhs.append(rhs[ri])
+                elif st == STREAM:
+                    trhs.append(empty)
+                elif st == TAPE:
+                    b, [d] = rhs[ri:ri+2]
+                    if d == 'L':
+                        p = -1
+                    elif d == 'S':
+                        p = 0
+                    elif d == 'R':
+                        p = len(b)
+                    else:
+                        raise ValueError('Invalid move {} (allowed moves are L, S, and R)'.format(repr(d)))
+                    trhs.append(share(Store(b.values, p)))
+            new.append(Transition(lhs, trhs))
+
+        self.transitions.extend(new)
 
     def get_transitions(self):
         """Return an iterator over all transitions, as AlignedTransitions.
@@ -442,29 +580,46 @@ class Machine:
 
         - For any stores of type TAPE, the generated transitions will
           have an additional field to indicate a move (L or R).
+
+        The AlignedTransitions are cached, so they are only rebuilt
+        for transitions that have been added since the last call.
         """
-        for t in self.transitions:
-            ts = []
-            for si, st in enumerate(self.store_types):
-                if st == BASE:
-                    ts.append(Transition([t.lhs[si]], [t.rhs[si]]))
-                elif st == STREAM:
-                    assert len(t.rhs[si]) == 0
-                    ts.append(Transition([t.lhs[si]], []))
-                elif st == TAPE:
-                    b = t.rhs[si].values
-                    if t.rhs[si].position == -1:
-                        d = 'L'
-                    elif t.rhs[si].position == 0:
-                        d = 'S'
-                    elif t.rhs[si].position == len(b):
-                        d = 'R'
-                    else:
-                        raise ValueError('No move for length {} and position {}'.format(len(b), t.rhs[si].position))
-                    ts.append(Transition([t.lhs[si]], [b, d]))
+        version = (self.store_types, self.transitions)
+        if self._aligned_version != version:
+            # Comparing lists checks identity first, so this is cheap
+            # when nothing has changed.
+            if self._aligned_version is not None and self._aligned_version[0] == self.store_types:
+                cache = dict(zip(self._aligned_version[1], self._aligned))
+            else:
+                cache = {}
+            self._aligned = [cache[t] if t in cache else self._align_transition(t)
+                             for t in self.transitions]
+            self._aligned_version = (self.store_types, list(self.transitions))
+        return iter(self._aligned)
+
+    def _align_transition(self, t):
+        """Convert a Transition into an AlignedTransition (see `get_transitions`)."""
+        ts = []
+        for si, st in enumerate(self.store_types):
+            if st == BASE:
+                ts.append(Transition([t.lhs[si]], [t.rhs[si]]))
+            elif st == STREAM:
+                assert len(t.rhs[si]) == 0
+                ts.append(Transition([t.lhs[si]], []))
+            elif st == TAPE:
+                b = t.rhs[si].values
+                if t.rhs[si].position == -1:
+                    d = 'L'
+                elif t.rhs[si].position == 0:
+                    d = 'S'
+                elif t.rhs[si].position == len(b):
+                    d = 'R'
                 else:
-                    assert False
-            yield AlignedTransition(ts)
+                    raise ValueError('No move for length {} and position {}'.format(len(b), t.rhs[si].position))
+                ts.append(Transition([t.lhs[si]], [b, d]))
+            else:
+                assert False
+        return AlignedTransition(ts)
 
     def __str__(self):
         return "\n".join(str(t) for t in self.get_transitions())
@@ -631,7 +786,6 @@ def from_transitions(transitions, start_state, accept_states):
     m.set_start_state(start_state)
     m.add_accept_states(accept_states)
 
-    for lhs, rhs in transitions:
-        m.add_transition(lhs, rhs)
+    m.add_transitions(transitions)
 
     return m
@@ -1,203 +1,1255 @@
 """This module contains various operations on automata."""
 
 import collections
+import itertools
+import random
 from . import machines
 from . import syntax
 
-def determinize(m):
-    """Determinizes a finite automaton."""
+__all__ = ['determinize', 'LazyDFA', 'minimize', 'count_strings', 'sample_strings', 'enumerate_strings',
+           'equivalent', 'is_subset', 'is_universal', 'intersect', 'prefix',
+           'reachable_states', 'coreachable_states', 'trim', 'remove_epsilons',
+           'alphabet_classes']
+
+def bits(s):
+    """Iterate over the elements of a set of integers represented as a
+    bitset (an `int` whose bit i is set iff i is in the set)."""
+    while s:
+        low = s & -s
+        yield low.bit_length()-1
+        s ^= low
+
+def strongly_connected_components(edges):
+    """Find the strongly connected components of a graph using Tarjan's
+    algorithm (without recursion).
+
+    Arguments:
+        edges: for each node u (numbered from 0), a list of the nodes v
+          such that there is an edge from u to v.
+
+    Returns:
+        A list of components, each of which is a list of nodes. If
+        there is a path from one component to another, the latter
+        comes first.
+    """
+    n = len(edges)
+    index = [None] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    components = []
+    counter = 0
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while len(work) > 0:
+            u, i = work.pop()
+            if i == 0:
+                index[u] = low[u] = counter
+                counter += 1
+                stack.append(u)
+                on_stack[u] = True
+            while i < len(edges[u]):
+                v = edges[u][i]
+                i += 1
+                if index[v] is None:
+                    work.append((u, i))
+                    work.append((v, 0))
+                    break
+                elif on_stack[v]:
+                    low[u] = min(low[u], index[v])
+            else:
+                # Finished visiting u
+                if low[u] == index[u]:
+                    component = []
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = False
+                        component.append(v)
+                        if v == u: break
+                    components.append(component)
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[u])
+    return components
+
+def epsilon_closures(eps):
+    """Compute the epsilon-closure of every state.
+
+    Arguments:
+        eps: for each state q (numbered from 0), a list of the states
+          reachable from q by one epsilon transition.
+
+    Returns:
+        For each state q, the set of states reachable from q by zero or
+        more epsilon transitions, as a bitset. All the states in a
+        strongly connected component share the same closure, which is
+        computed only once.
+    """
+    closure = [0] * len(eps)
+    for component in strongly_connected_components(eps):
+        c = 0
+        for q in component:
+            c |= 1 << q
+        for q in component:
+            for r in eps[q]:
+                c |= closure[r]
+        for q in component:
+            closure[q] = c
+    return closure
+
+def reachable(edges, sources):
+    """Find the nodes of a graph reachable from `sources`, in time linear
+    in the size of the graph.
+
+    Arguments:
+        edges: for each node u (numbered from 0), a list of the nodes v
+          such that there is an edge from u to v.
+        sources: the nodes to start from.
+
+    Returns:
+        A list of the reachable nodes, in breadth-first order.
+    """
+    visited = [False] * len(edges)
+    order = []
+    for u in sources:
+        if not visited[u]:
+            visited[u] = True
+            order.append(u)
+    for u in order:
+        for v in edges[u]:
+            if not visited[v]:
+                visited[v] = True
+                order.append(v)
+    return order
+
+def state_graph(m):
+    """The graph whose nodes are the states of `m` and which has an edge
+    from q to r for each transition from state q to state r, ignoring
+    all the other stores.
+
+    Returns:
+        A tuple `(states, index, forward, backward)`, where `states` is
+        the list of states, `index` maps each state to its number, and
+        `forward` and `backward` are, for each state number, the list
+        of numbers of its successors and predecessors.
+    """
+    if m.state is None:
+        raise ValueError("This Machine doesn't have a state")
+    states = sorted(m.states | {m.get_start_state()} | m.get_accept_states())
+    index = {q: i for i, q in enumerate(states)}
+    forward = [[] for q in states]
+    backward = [[] for q in states]
+    for t in m.transitions:
+        q, r = index[t.lhs[m.state][0]], index[t.rhs[m.state][0]]
+        forward[q].append(r)
+        backward[r].append(q)
+    return states, index, forward, backward
+
+def reachable_states(m):
+    """The set of states of `m` that are reachable from the start state,
+    considering only the states, not the other stores."""
+    states, index, forward, backward = state_graph(m)
+    return {states[q] for q in reachable(forward, [index[m.get_start_state()]])}
+
+def coreachable_states(m):
+    """The set of states of `m` from which an accept state is reachable,
+    considering only the states, not the other stores."""
+    states, index, forward, backward = state_graph(m)
+    return {states[q] for q in reachable(backward, [index[q] for q in m.get_accept_states()])}
+
+def trim(m):
+    """Remove the useless states of `m`, that is, the states that are not
+    reachable from the start state or from which no accept state is
+    reachable. The start state is always kept. For machines with stores
+    other than the state and input, this only removes states that are
+    useless regardless of the other stores.
+    """
+    states, index, forward, backward = state_graph(m)
+    start = index[m.get_start_state()]
+    keep = (set(reachable(forward, [start])) &
+            set(reachable(backward, [index[q] for q in m.get_accept_states()])))
+    keep = {states[q] for q in keep} | {states[start]}
+
+    mt = machines.Machine(m.store_types, state=m.state, input=m.input)
+    mt.start_config = m.start_config
+    mt.accept_configs = {c for c in m.accept_configs if c[m.state][0] in keep}
+    mt.transitions = [t for t in m.transitions
+                      if t.lhs[m.state][0] in keep and t.rhs[m.state][0] in keep]
+    return mt
+
+def remove_epsilons(m):
+    """Remove the epsilon transitions from a finite automaton. For each
+    state q and each transition from a state in the epsilon-closure of
+    q reading a symbol a to state r, the result has a transition from q
+    reading a to r, and q is an accept state if its epsilon-closure
+    contains one. States that are no longer reachable are removed.
+    """
     if not m.is_finite():
         raise TypeError("machine must be a finite automaton")
+    states, index, _, _ = state_graph(m)
+    eps = [[] for q in states]
+    delta = [[] for q in states]
+    for t in m.get_transitions():
+        [[lstate], read] = t.lhs
+        [[rstate]] = t.rhs
+        q, r = index[lstate], index[rstate]
+        if len(read) == 0:
+            eps[q].append(r)
+        else:
+            delta[q].append((read, r))
+    closure = epsilon_closures(eps)
+    accept = {index[q] for q in m.get_accept_states()}
+
+    forward = [[r for p in bits(closure[q]) for _, r in delta[p]] for q in range(len(states))]
+    keep = reachable(forward, [index[m.get_start_state()]])
 
-    transitions = collections.defaultdict(lambda: collections.defaultdict(set))
-    alphabet = set()
-    for transition in m.get_transitions():
-        [[lstate], read] = transition.lhs
-        [[rstate]] = transition.rhs
-        if len(read) > 1:
-            raise NotSupportedException("multiple input symbols on transition not supported")
+    mr = machines.FiniteAutomaton()
+    mr.set_start_state(m.get_start_state())
+    transitions = {}
+    for q in keep:
+        for p in bits(closure[q]):
+            for read, r in delta[p]:
+                transitions[q, read, r] = None
+    mr.add_transitions(([[states[q]], read], [[states[r]]]) for q, read, r in transitions)
+    mr.add_accept_states(states[q] for q in keep if any(p in accept for p in bits(closure[q])))
+    return mr
+
+def alphabet_classes(m):
+    """Partition the input alphabet of `m` into classes of symbols that
+    behave identically as input: two symbols are in the same class iff
+    exchanging them in the input of every transition leaves the set of
+    transitions unchanged. Algorithms that loop over the input
+    alphabet can then do the work once per class instead of once per
+    symbol.
+
+    Only the input is considered. If a symbol is also used in another
+    store (for example, pushed onto a stack), symbols in the same
+    class are not interchangeable there.
+
+    Returns:
+        A list of classes, each of which is a sorted list of symbols.
+    """
+    if m.input is None:
+        raise ValueError("This Machine doesn't have an input")
+    signature = collections.defaultdict(set)
+    for t in m.transitions:
+        read = t.lhs[m.input]
         if len(read) == 1:
-            alphabet.add(read[0])
-        transitions[lstate][tuple(read)].add(rstate)
-
-    def eclosure(states):
-        """Find epsilon-closure of set of states."""
-        states = set(states)
-        frontier = set(states)
-        while len(frontier) > 0:
-            lstate = frontier.pop()
-            for rstate in transitions[lstate][()]:
-                if rstate not in states:
-                    states.add(rstate)
-                    frontier.add(rstate)
-        return states
-
-    dm = machines.FiniteAutomaton()
-
-    start_state = syntax.Set(eclosure([m.get_start_state()]))
-    dm.set_start_state(start_state)
-
-    frontier = {start_state}
-    visited = set()
-    while len(frontier) > 0:
-        lstates = frontier.pop()
-        if lstates in visited:
-            continue
-        visited.add(lstates)
-        dtransitions = collections.defaultdict(set)
-        for lstate in lstates:
-            for read in alphabet:
-                dtransitions[read] |= transitions[lstate][(read,)]
-        for read in alphabet:
-            rstates = syntax.Set(eclosure(dtransitions[read]))
-            dm.add_transition([[lstates], read], [[rstates]])
-            frontier.add(rstates)
-
-    accept_states = set(m.get_accept_states())
-    for states in visited:
-        if len(states & accept_states) > 0:
-            dm.add_accept_state(states)
-
-    return dm
-
-def equivalent(m1, m2):
-    """Test whether two DFAs are equivalent, using the Hopcroft-Karp algorithm."""
-    if not m1.is_finite() and m1.is_deterministic():
-        raise TypeError("machine must be a deterministic finite automaton")
-    if not m2.is_finite() and m2.is_deterministic():
-        raise TypeError("machine must be a deterministic finite automaton")
-
-    # Index transitions. We use tuples (1,q) and (2,q) to rename apart state sets
-    alphabet = set()
-    d = {}
-    for t in m1.get_transitions():
-        [[q], a] = t.lhs
-        [[r]] = t.rhs
-        alphabet.add(a)
-        d[(1,q),a] = (1,r)
-    for t in m2.get_transitions():
-        [[q], a] = t.lhs
-        [[r]] = t.rhs
-        alphabet.add(a)
-        d[(2,q),a] = (2,r)
-
-    # Naive union find data structure
-    u = {}
-    def union(x, y):
-        for z in u:
-            if u[z] == x:
-                u[z] = y
-
-    for q in m1.states:
-        u[1,q] = (1,q)
-    for q in m2.states:
-        u[2,q] = (2,q)
-
-    s = []
-
-    s1 = (1,m1.get_start_state())
-    s2 = (2,m2.get_start_state())
-    union(s1, s2)
-    s.append((s1, s2))
-
-    while len(s) > 0:
-        q1, q2 = s.pop()
-        for a in alphabet:
-            r1 = u[d[q1,a]]
-            r2 = u[d[q2,a]]
-            if r1 != r2:
-                union(r1, r2)
-                s.append((r1, r2))
-
-    cls = {}
-    f = ( {(1, q) for q in m1.get_accept_states()} | 
-          {(2, q) for q in m2.get_accept_states()} )
-
-    for q in u:
-        if u[q] not in cls:
-            cls[u[q]] = q in f
-        elif (q in f) != cls[u[q]]:
+            rest = t.lhs.stores[:m.input] + t.lhs.stores[m.input+1:]
+            signature[read[0]].add((rest, t.rhs))
+        else:
+            # A symbol in a multi-symbol transition is in a class by itself
+            for a in read:
+                signature[a].add(a)
+    classes = collections.defaultdict(list)
+    for a in sorted(signature):
+        classes[frozenset(signature[a])].append(a)
+    return sorted(classes.values())
+
+class IndexedNFA:
+    """A finite automaton with its states numbered and its epsilon
+    transitions removed, so that sets of states can be represented as
+    bitsets. This is the common starting point for `determinize` and
+    other operations that simulate sets of states.
+
+    Arguments:
+        m (Machine): a finite automaton whose transitions read at most
+          one symbol
+
+    Attributes:
+        states: list of the states of `m`; state number q is `states[q]`
+        index: dict mapping each state of `m` to its number
+        alphabet: sorted list of input symbols
+        step: for each state number q, a dict mapping each symbol a
+          (that is the first of its class) to the bitset of states
+          reachable from q by reading a, followed by zero or more
+          epsilon transitions
+        start: the bitset of states reachable from the start state by
+          zero or more epsilon transitions
+        accept: the bitset of accept states
+        classes: the alphabet partitioned into classes of symbols that
+          have the same transitions (see `alphabet_classes`)
+        rep: dict mapping each symbol to the first symbol of its class
+
+    States from which no accept state can be reached are left out of
+    `step` and `start`, so they never appear in sets of states. To
+    save work when many symbols behave identically, `step` only has
+    entries for the first symbol of each class.
+    """
+    def __init__(self, m):
+        if not m.is_finite():
+            raise TypeError("machine must be a finite automaton")
+
+        self.states = sorted(m.states | {m.get_start_state()} | m.get_accept_states())
+        self.index = {q: i for i, q in enumerate(self.states)}
+        alphabet = set()
+        eps = [[] for q in self.states]
+        delta = [collections.defaultdict(int) for q in self.states]
+        for transition in m.get_transitions():
+            [[lstate], read] = transition.lhs
+            [[rstate]] = transition.rhs
+            q, r = self.index[lstate], self.index[rstate]
+            if len(read) > 1:
+                raise NotImplementedError("multiple input symbols on transition not supported")
+            elif len(read) == 1:
+                alphabet.add(read[0])
+                delta[q][read[0]] |= 1 << r
+            else:
+                eps[q].append(r)
+        self.alphabet = sorted(alphabet)
+
+        self.classes = alphabet_classes(m)
+        self.rep = {a: c[0] for c in self.classes for a in c}
+
+        closure = epsilon_closures(eps)
+        self.step = []
+        for q in range(len(self.states)):
+            step_q = {}
+            for a, rs in delta[q].items():
+                if self.rep[a] != a: continue
+                c = 0
+                for r in bits(rs):
+                    c |= closure[r]
+                step_q[a] = c
+            self.step.append(step_q)
+
+        self.accept = 0
+        for q in m.get_accept_states():
+            self.accept |= 1 << self.index[q]
+
+        # Remove states from which no accept state is reachable, so
+        # that they never appear in sets of states
+        backward = [[] for q in self.states]
+        for q in range(len(self.states)):
+            for r in eps[q]:
+                backward[r].append(q)
+            for rs in delta[q].values():
+                for r in bits(rs):
+                    backward[r].append(q)
+        live = 0
+        for q in reachable(backward, bits(self.accept)):
+            live |= 1 << q
+        for step_q in self.step:
+            for a in step_q:
+                step_q[a] &= live
+        self.start = closure[self.index[m.get_start_state()]] & live
+
+    def move(self, s, a):
+        """The bitset of states reachable from bitset `s` by reading `a`."""
+        a = self.rep.get(a)
+        r = 0
+        for q in bits(s):
+            r |= self.step[q].get(a, 0)
+        return r
+
+    def moves(self, s):
+        """A dict mapping the first symbol `a` of every class to `move(s, a)`."""
+        succ = {c[0]: 0 for c in self.classes}
+        for q in bits(s):
+            for a, rs in self.step[q].items():
+                succ[a] |= rs
+        return succ
+
+    def name(self, s):
+        """A Symbol naming bitset `s`, like `{q1,q2}`."""
+        return syntax.Symbol(syntax.Set(self.states[q] for q in bits(s)))
+
+    def is_deterministic(self):
+        """Returns True iff the start state and every transition lead to
+        exactly one (live) state."""
+        def single(s):
+            return s != 0 and s & (s-1) == 0
+        return single(self.start) and all(rs == 0 or single(rs) for step_q in self.step for rs in step_q.values())
+
+class IndexedDFA:
+    """A deterministic finite automaton with its states and symbols
+    numbered. Use `from_machine` or `subset_construction` to create one.
+
+    Attributes:
+        states: list of the names (Symbols) of the states
+        alphabet: sorted list of input symbols
+        delta: for each state q, a dict mapping symbol a to the state
+          reached from q by reading a; it may be partial
+        start: the start state
+        accept: set of accept states
+        classes: the alphabet partitioned into classes of symbols that
+          have the same transitions (default: one class per symbol)
+    """
+    def __init__(self, states, alphabet, delta, start, accept, classes=None):
+        self.states = states
+        self.alphabet = alphabet
+        self.delta = delta
+        self.start = start
+        self.accept = accept
+        if classes is None:
+            classes = [[a] for a in alphabet]
+        self.classes = classes
+
+    @classmethod
+    def from_machine(cls, m):
+        """Convert a finite automaton to an IndexedDFA, determinizing it only
+        if it is not already deterministic."""
+        nfa = IndexedNFA(m)
+        if not nfa.is_deterministic():
+            return subset_construction(nfa)
+        bit = {1 << q: q for q in range(len(nfa.states))}
+        classes = {c[0]: c for c in nfa.classes}
+        return cls(nfa.states,
+                   nfa.alphabet,
+                   [{a: bit[rs] for b, rs in step_q.items() if rs != 0 for a in classes[b]}
+                    for step_q in nfa.step],
+                   bit[nfa.start],
+                   {q for q in range(len(nfa.states)) if nfa.accept & (1 << q)},
+                   nfa.classes)
+
+    def reachable(self):
+        """Return a list of the states reachable from the start state, in
+        breadth-first order."""
+        visited = {self.start}
+        order = [self.start]
+        for q in order:
+            for r in self.delta[q].values():
+                if r not in visited:
+                    visited.add(r)
+                    order.append(r)
+        return order
+
+    def to_machine(self):
+        """Convert to a `Machine`."""
+        dm = machines.FiniteAutomaton()
+        dm.set_start_state(self.states[self.start])
+        dm.add_transitions(([[self.states[q]], a], [[self.states[r]]])
+                           for q in range(len(self.states))
+                           for a, r in self.delta[q].items())
+        dm.add_accept_states(self.states[q] for q in self.accept)
+        return dm
+
+def subset_construction(nfa):
+    """Determinize an `IndexedNFA` using the subset construction. The
+    states of the resulting `IndexedDFA` are named by sets of states
+    of the NFA, and it is complete, so it may include the empty set as
+    a state.
+    """
+    # The DFA states are numbered in the order they are discovered.
+    # Moves are computed once per class of symbols.
+    classes = {c[0]: c for c in nfa.classes}
+    ids = {nfa.start: 0}
+    subsets = [nfa.start]
+    delta = []
+    i = 0
+    while i < len(subsets):
+        delta_i = {}
+        for b, rs in nfa.moves(subsets[i]).items():
+            if rs not in ids:
+                ids[rs] = len(subsets)
+                subsets.append(rs)
+            r = ids[rs]
+            for a in classes[b]:
+                delta_i[a] = r
+        delta.append(delta_i)
+        i += 1
+    return IndexedDFA([nfa.name(s) for s in subsets],
+                      nfa.alphabet,
+                      delta,
+                      0,
+                      {i for i, s in enumerate(subsets) if s & nfa.accept},
+                      nfa.classes)
+
+def determinize(m):
+    """Determinizes a finite automaton.
+
+    The states of the resulting DFA are sets of states of `m`. The DFA
+    is complete, so it may include the empty set as a state.
+    """
+    return subset_construction(IndexedNFA(m)).to_machine()
+
+def hopcroft(n, k, delta, accept):
+    """Find the coarsest partition of the states of a complete DFA that
+    respects its transitions and accept states, using Hopcroft's
+    algorithm, which takes O(kn log n) time.
+
+    Arguments:
+        n (int): number of states
+        k (int): number of symbols
+        delta: for each state q, a list of the states reached from q
+          by reading symbol 0, ..., k-1
+        accept: set of accept states
+
+    Returns:
+        A list mapping each state to its block number.
+    """
+    # inverse[a][r] is the list of states q such that delta[q][a] == r
+    inverse = [[[] for r in range(n)] for a in range(k)]
+    for q in range(n):
+        for a, r in enumerate(delta[q]):
+            inverse[a][r].append(q)
+
+    blocks = [b for b in [set(accept), set(range(n)) - set(accept)] if len(b) > 0]
+    block_of = [None] * n
+    for i, b in enumerate(blocks):
+        for q in b:
+            block_of[q] = i
+    agenda = {min(range(len(blocks)), key=lambda i: len(blocks[i]))} if len(blocks) == 2 else set()
+
+    while len(agenda) > 0:
+        splitter = list(blocks[agenda.pop()])
+        for a in range(k):
+            # Group the predecessors of splitter by block
+            touched = collections.defaultdict(list)
+            for r in splitter:
+                for q in inverse[a][r]:
+                    touched[block_of[q]].append(q)
+            for i, qs in touched.items():
+                if len(qs) == len(blocks[i]):
+                    continue
+                # Split block i into qs and the rest
+                new = set(qs)
+                blocks[i] -= new
+                j = len(blocks)
+                blocks.append(new)
+                for q in new:
+                    block_of[q] = j
+                if i in agenda or len(new) <= len(blocks[i]):
+                    agenda.add(j)
+                else:
+                    agenda.add(i)
+    return block_of
+
+def minimize(m, complete=True, remove_unreachable=True):
+    """Minimizes a finite automaton using Hopcroft's algorithm. If `m`
+    is not deterministic, it is determinized first.
+
+    Each state of the result is named by the state of `m` it comes
+    from or, if several states were merged, by the set of those states.
+
+    Arguments:
+        m (Machine): the automaton to minimize, which must be a finite automaton.
+        complete (bool): if True, the result has a transition for every
+          state and symbol, adding a sink state if necessary. If False,
+          states that cannot reach an accept state are removed instead.
+        remove_unreachable (bool): if True, states that are not reachable
+          from the start state are removed.
+
+    Returns:
+        Machine: a minimal DFA equivalent to `m`.
+    """
+    d = IndexedDFA.from_machine(m)
+    # Symbols in the same class behave identically, so work with classes
+    symbol_index = {a: i for i, c in enumerate(d.classes) for a in c}
+    k = len(d.classes)
+
+    # Renumber the states to be kept; state n-1 is a sink state.
+    if remove_unreachable:
+        old = d.reachable()
+    else:
+        old = list(range(len(d.states)))
+    new = {q: i for i, q in enumerate(old)}
+    n = len(old) + 1
+    sink = n-1
+    delta = []
+    for q in old:
+        delta_q = [sink] * k
+        for a, r in d.delta[q].items():
+            delta_q[symbol_index[a]] = new[r]
+        delta.append(delta_q)
+    delta.append([sink] * k)
+    accept = {new[q] for q in old if q in d.accept}
+
+    block_of = hopcroft(n, k, delta, accept)
+
+    # Find the block containing the sink, and whether any real state
+    # needed it
+    sink_block = block_of[sink]
+    if complete:
+        needs_sink = any(r == sink for q in range(n-1) for r in delta[q])
+    else:
+        needs_sink = False
+    keep = {block_of[q] for q in range(n-1)}
+    if needs_sink:
+        keep.add(sink_block)
+    if not complete:
+        keep.discard(sink_block)
+        keep.add(block_of[new[d.start]])
+
+    members = collections.defaultdict(list)
+    for q in range(n-1):
+        members[block_of[q]].append(d.states[old[q]])
+    names = {}
+    for b in keep:
+        if len(members[b]) == 1:
+            [names[b]] = members[b]
+        else:
+            names[b] = syntax.Symbol(syntax.Set(members[b]))
+    
+    mm = machines.FiniteAutomaton()
+    mm.set_start_state(names[block_of[new[d.start]]])
+    transitions = {}
+    for q in range(n):
+        b = block_of[q]
+        if b in keep:
+            for c, r in zip(d.classes, delta[q]):
+                if block_of[r] in keep:
+                    for a in c:
+                        transitions[b, a] = block_of[r]
+    mm.add_transitions(([[names[b]], a], [[names[c]]]) for (b, a), c in transitions.items())
+    mm.add_accept_states(names[block_of[q]] for q in accept)
+    return mm
+
+class LazyDFA:
+    """A DFA equivalent to a finite automaton `m`, whose states and
+    transitions are constructed only when they are needed. This avoids
+    the (possibly exponential) cost of `determinize` when only a few
+    states are ever visited.
+
+    The states are bitsets as in `IndexedNFA`. Constructed states are
+    kept in a cache of at most `cache_size` states; when it is full,
+    the least recently used state (with its transitions) is discarded,
+    to be rebuilt if it is needed again.
+
+    Arguments:
+        m (Machine): a finite automaton
+        cache_size (int): maximum number of states to keep
+    """
+    def __init__(self, m, cache_size=10000):
+        self.nfa = IndexedNFA(m)
+        self.start = self.nfa.start
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def step(self, s, a):
+        """Return the state reached from state `s` by reading symbol `a`."""
+        # Symbols in the same class share their cache entries
+        b = self.nfa.rep.get(a)
+        try:
+            transitions = self.cache[s]
+            self.cache.move_to_end(s)
+        except KeyError:
+            transitions = self.cache[s] = {}
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        try:
+            r = transitions[b]
+            self.hits += 1
+        except KeyError:
+            r = transitions[b] = self.nfa.move(s, a)
+            self.misses += 1
+        return r
+
+    def is_accept(self, s):
+        return s & self.nfa.accept != 0
+
+    def name(self, s):
+        """A Symbol naming state `s`, like `{q1,q2}`."""
+        return self.nfa.name(s)
+
+    def accepts(self, w):
+        """Returns True iff the automaton accepts string `w`."""
+        if isinstance(w, str):
+            w = syntax.String(w)
+        s = self.start
+        for a in w:
+            s = self.step(s, a)
+            if s == 0:
+                return False
+        return self.is_accept(s)
+
+def count_rows(d, n):
+    """For k = 0, ..., n, yield a list giving, for each state number q
+    of `IndexedDFA` `d`, the number of strings of length k that lead
+    from q to an accept state."""
+    succ = [list(delta_q.values()) for delta_q in d.delta]
+    c = [1 if q in d.accept else 0 for q in range(len(d.states))]
+    yield c
+    for k in range(n):
+        c = [sum(map(c.__getitem__, succ_q)) for succ_q in succ]
+        yield c
+
+def count_table(m, n):
+    """Determinize finite automaton `m` and compute, for each k <= n
+    and each state q, the number of strings of length k that lead from
+    q to an accept state.
+
+    Returns:
+        A pair `(d, table)` where `d` is an `IndexedDFA` and
+        `table[k][q]` is the count for state number `q` of `d`.
+    """
+    d = IndexedDFA.from_machine(m)
+    return d, list(count_rows(d, n))
+
+def count_strings(m, n):
+    """Count the strings of length `n` accepted by finite automaton `m`
+    (which is determinized first, so that each string is counted once).
+
+    This takes time linear in `n` and the size of the DFA, and the
+    counts are exact however large they are.
+    """
+    if not m.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    d = IndexedDFA.from_machine(m)
+    # Same as count_table, but only the last row is kept
+    for c in count_rows(d, n):
+        pass
+    return c[d.start]
+
+def sample_strings(m, n, k=1, rng=None):
+    """Sample `k` strings of length `n` uniformly (with replacement) from
+    the strings accepted by finite automaton `m`.
+
+    Arguments:
+        m (Machine): a finite automaton
+        n (int): length of strings
+        k (int): number of strings to sample
+        rng (random.Random): source of randomness (default: the `random` module)
+
+    Returns:
+        A list of `k` Strings.
+    """
+    if not m.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    if rng is None:
+        rng = random
+    d, table = count_table(m, n)
+    if table[n][d.start] == 0:
+        raise ValueError(f"machine accepts no strings of length {n}")
+
+    samples = []
+    for _ in range(k):
+        q = d.start
+        w = []
+        for i in range(n, 0, -1):
+            # Choose the next symbol with probability proportional
+            # to the number of accepted completions
+            x = rng.randrange(table[i][q])
+            for a, r in d.delta[q].items():
+                x -= table[i-1][r]
+                if x < 0:
+                    break
+            w.append(a)
+            q = r
+        samples.append(syntax.String(w))
+    return samples
+
+def enumerate_strings(m, max_len, max_stack=None):
+    """Generate the strings of length at most `max_len` accepted by `m`,
+    in shortlex order (shorter strings first, and strings of the same
+    length in lexicographic order).
+
+    The strings are generated a length at a time, carrying the state of
+    the simulation along from each prefix to its extensions, so no
+    prefix is simulated twice. Prefixes that cannot be extended to an
+    accepted string are pruned.
+
+    Arguments:
+        m (Machine): a finite automaton, or a machine whose input is a
+          STREAM, like a PDA.
+        max_len (int): maximum length of strings to generate.
+        max_stack (int): for machines other than finite automata,
+          configurations in which a store (other than the input) is
+          longer than this are not explored, so strings that need a
+          deeper stack are missed (default: `max_len`+2).
+
+    Yields:
+        Strings accepted by `m`.
+    """
+    if m.is_finite():
+        level_strings = enumerate_finite(m, max_len)
+    else:
+        if max_stack is None:
+            max_stack = max_len+2
+        level_strings = enumerate_configs(m, max_len, max_stack)
+    for level in level_strings:
+        yield from level
+
+def enumerate_finite(m, max_len):
+    """Helper for `enumerate_strings` for finite automata. Generates,
+    for each length, the list of accepted strings of that length."""
+    d = LazyDFA(m)
+    nfa = d.nfa
+
+    # For each state, the length of the shortest string that leads
+    # to an accept state
+    backward = [[] for q in nfa.states]
+    for q, step_q in enumerate(nfa.step):
+        for rs in step_q.values():
+            for r in bits(rs):
+                backward[r].append(q)
+    infinity = max_len+1
+    dist = [infinity] * len(nfa.states)
+    for q in bits(nfa.accept):
+        dist[q] = 0
+    for r in reachable(backward, bits(nfa.accept)):
+        for q in backward[r]:
+            if dist[q] > dist[r]+1:
+                dist[q] = dist[r]+1
+    def distance(s):
+        return min((dist[q] for q in bits(s)), default=infinity)
+
+    level = [((), d.start)] if distance(d.start) <= max_len else []
+    for n in range(max_len+1):
+        yield [syntax.String(w) for w, s in level if d.is_accept(s)]
+        if n == max_len:
+            break
+        next_level = []
+        for w, s in level:
+            for a in nfa.alphabet:
+                r = d.step(s, a)
+                if distance(r) <= max_len-n-1:
+                    next_level.append((w+(a,), r))
+        level = next_level
+
+def enumerate_configs(m, max_len, max_stack):
+    """Helper for `enumerate_strings` for machines other than finite
+    automata. Generates, for each length, the list of accepted strings
+    of that length."""
+    from .runs import index_transitions
+    if not m.has_input_stream(m.input):
+        raise TypeError("machine's input must be a stream")
+    transitions = index_transitions(m)
+    reading = collections.defaultdict(list)
+    for t in m.transitions:
+        if len(t.lhs[m.input]) > 1:
+            raise NotImplementedError("multiple input symbols on transition not supported")
+        elif len(t.lhs[m.input]) == 1:
+            reading[t.lhs[m.input][0]].append(t)
+    alphabet = sorted(reading)
+    live = coreachable_states(m) if m.state is not None else None
+    empty = machines.Store()
+
+    def ok(config):
+        if live is not None and config[m.state][0] not in live:
+            return False
+        return all(len(store) <= max_stack for i, store in enumerate(config) if i != m.input)
+
+    def closure(configs):
+        """Close a set of configurations (with empty input) under
+        epsilon transitions."""
+        configs = {c for c in configs if ok(c)}
+        agenda = list(configs)
+        while len(agenda) > 0:
+            config = agenda.pop()
+            for t in transitions(config):
+                if len(t.lhs[m.input]) == 0 and t.match(config):
+                    nconfig = t.apply(config)
+                    if nconfig not in configs and ok(nconfig):
+                        configs.add(nconfig)
+                        agenda.append(nconfig)
+        return frozenset(configs)
+
+    def with_input(config, store):
+        config = list(config)
+        config[m.input] = store
+        return machines.Configuration(config)
+
+    # Different prefixes often lead to the same set of configurations,
+    # so cache the results of step and is_accept
+    step_cache = {}
+    def step(configs, a):
+        if (configs, a) not in step_cache:
+            store = machines.Store([a])
+            nconfigs = set()
+            for config in configs:
+                config = with_input(config, store)
+                for t in reading[a]:
+                    if t.match(config):
+                        nconfigs.add(t.apply(config))
+            step_cache[configs, a] = closure(nconfigs)
+        return step_cache[configs, a]
+    accept_cache = {}
+    def is_accept(configs):
+        if configs not in accept_cache:
+            accept_cache[configs] = any(aconfig.match(config)
+                                        for config in configs
+                                        for aconfig in m.accept_configs)
+        return accept_cache[configs]
+
+    start = closure([with_input(m.start_config, empty)])
+    level = [((), start)] if len(start) > 0 else []
+    for n in range(max_len+1):
+        yield [syntax.String(w) for w, configs in level if is_accept(configs)]
+        if n == max_len:
+            break
+        next_level = []
+        for w, configs in level:
+            for a in alphabet:
+                nconfigs = step(configs, a)
+                if len(nconfigs) > 0:
+                    next_level.append((w+(a,), nconfigs))
+        level = next_level
+
+class UnionFind:
+    """Disjoint sets with path compression and union by rank. Elements
+    are added the first time they are used."""
+    def __init__(self):
+        self.parent = {}
+        self.rank = {}
+
+    def find(self, x):
+        """Return the representative of the set containing `x`."""
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+            self.rank[x] = 0
+            return x
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x, y):
+        """Merge the sets containing `x` and `y`. Returns False if they
+        were already the same set."""
+        x = self.find(x)
+        y = self.find(y)
+        if x == y:
             return False
-    return True
+        if self.rank[x] < self.rank[y]:
+            x, y = y, x
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.rank[x] += 1
+        return True
 
-def intersect(m1, m2):
-    """Intersect two Machines.
+def equivalent(m1, m2, counterexample=False):
+    """Test whether two finite automata are equivalent, using the
+    Hopcroft-Karp algorithm.
+
+    The automata need not be deterministic or complete; they are
+    determinized on demand, so only the pairs of states that are
+    reachable together are ever constructed.
+
+    Arguments:
+        m1, m2 (Machine): finite automata
+        counterexample (bool): if True, return a shortest string
+          accepted by one automaton but not the other, or None if they
+          are equivalent.
+
+    Returns:
+        bool, or String or None if `counterexample` is True.
+    """
+    if not m1.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    if not m2.is_finite():
+        raise TypeError("machine must be a finite automaton")
+
+    d1 = LazyDFA(m1)
+    d2 = LazyDFA(m2)
+    # Only one symbol is needed from each group of symbols that are in
+    # the same class in both automata
+    alphabet = {}
+    for a in sorted(set(d1.nfa.alphabet) | set(d2.nfa.alphabet)):
+        alphabet.setdefault((d1.nfa.rep.get(a), d2.nfa.rep.get(a)), a)
+    alphabet = list(alphabet.values())
+
+    # We use tuples (1,s) and (2,s) to rename apart the state sets.
+    # Each agenda item has a pointer to the item it was reached from,
+    # so the string leading to it can be recovered.
+    u = UnionFind()
+    s1, s2 = d1.start, d2.start
+    u.union((1,s1), (2,s2))
+    agenda = collections.deque()
+    item = (s1, s2, None, None)
+
+    while True:
+        s1, s2, _, _ = item
+        if d1.is_accept(s1) != d2.is_accept(s2):
+            if not counterexample:
+                return False
+            w = []
+            while item[2] is not None:
+                w.append(item[3])
+                item = item[2]
+            return syntax.String(w[::-1])
+        for a in alphabet:
+            r1 = d1.step(s1, a)
+            r2 = d2.step(s2, a)
+            if u.union((1,r1), (2,r2)):
+                agenda.append((r1, r2, item, a))
+        if len(agenda) == 0:
+            break
+        item = agenda.popleft()
+    return None if counterexample else True
 
-    Both machines should have a state as store 0 and input STREAM as
-    store 1. For example, 
+def antichain_search(starts, successors, is_bad, key):
+    """Search for a bad item using breadth-first search pruned by
+    subsumption. Items are pairs (k, s) where s is a bitset; (k, s) is
+    subsumed by (k, s') if s' is a subset of s, and then only (k, s')
+    needs to be explored.
 
-    - Both can be finite automata, in which case this is the standard
+    Arguments:
+        starts: the initial items
+        successors: function mapping an item to a list of pairs (a, item')
+        is_bad: function returning True iff an item is bad
+        key: function mapping an item to the pair (k, s)
+
+    Returns:
+        A String of the `a`s along a path from an initial item to a
+        bad item, or None if there is none.
+    """
+    antichain = collections.defaultdict(set)
+    def insert(item):
+        k, s = key(item)
+        sets = antichain[k]
+        for t in sets:
+            if t & s == t:
+                return False
+        sets.difference_update([t for t in sets if t & s == s])
+        sets.add(s)
+        return True
+
+    # Each agenda entry has a pointer to the entry it was reached from
+    agenda = collections.deque()
+    def visit(entry):
+        if is_bad(entry[0]):
+            w = []
+            while entry[1] is not None:
+                w.append(entry[2])
+                entry = entry[1]
+            return syntax.String(w[::-1])
+        agenda.append(entry)
+
+    for item in starts:
+        if insert(item):
+            w = visit((item, None, None))
+            if w is not None:
+                return w
+    while len(agenda) > 0:
+        entry = agenda.popleft()
+        k, s = key(entry[0])
+        if s not in antichain[k]:
+            continue # subsumed since it was added
+        for a, succ in successors(entry[0]):
+            if insert(succ):
+                w = visit((succ, entry, a))
+                if w is not None:
+                    return w
+    return None
+
+def is_subset(m1, m2, counterexample=False):
+    """Test whether the language of finite automaton `m1` is a subset of
+    the language of finite automaton `m2`.
+
+    Neither automaton needs to be deterministic. The search runs over
+    pairs of a state of `m1` and a set of states of `m2`, discarding
+    pairs whose set includes the set of another pair with the same
+    state (an antichain), so usually only a small part of the subset
+    construction of `m2` is built.
+
+    Arguments:
+        m1, m2 (Machine): finite automata
+        counterexample (bool): if True, return a string accepted by
+          `m1` but not `m2`, or None if there is none.
+
+    Returns:
+        bool, or String or None if `counterexample` is True.
+    """
+    if not m1.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    if not m2.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    nfa1 = IndexedNFA(m1)
+    nfa2 = LazyDFA(m2)
+
+    classes = {c[0]: c for c in nfa1.classes}
+    def successors(item):
+        p, s = item
+        result = []
+        for b, ps in nfa1.step[p].items():
+            # Symbols in the same class for m1 may not be for m2
+            for a in classes[b]:
+                r = nfa2.step(s, a)
+                for q in bits(ps):
+                    result.append((a, (q, r)))
+        return result
+    def is_bad(item):
+        p, s = item
+        return nfa1.accept & (1 << p) != 0 and not nfa2.is_accept(s)
+
+    w = antichain_search([(p, nfa2.start) for p in bits(nfa1.start)],
+                         successors, is_bad, lambda item: item)
+    if counterexample:
+        return w
+    return w is None
+
+def is_universal(m, alphabet=None, counterexample=False):
+    """Test whether finite automaton `m` accepts every string over
+    `alphabet`.
+
+    The automaton does not need to be deterministic. The search runs
+    over sets of states, discarding sets that include another set
+    already found (an antichain), so usually only a small part of the
+    subset construction is built.
+
+    Arguments:
+        m (Machine): a finite automaton
+        alphabet: the input alphabet (default: the symbols used in `m`)
+        counterexample (bool): if True, return a string rejected by `m`,
+          or None if there is none.
+
+    Returns:
+        bool, or String or None if `counterexample` is True.
+    """
+    if not m.is_finite():
+        raise TypeError("machine must be a finite automaton")
+    d = LazyDFA(m)
+    if alphabet is None:
+        alphabet = d.nfa.alphabet
+    else:
+        alphabet = sorted(syntax.Symbol(a) for a in alphabet)
+    # Only one symbol is needed from each class
+    first = {}
+    for a in alphabet:
+        first.setdefault(d.nfa.rep.get(a), a)
+    alphabet = list(first.values())
+
+    def successors(s):
+        return [(a, d.step(s, a)) for a in alphabet]
+    def is_bad(s):
+        return not d.is_accept(s)
+
+    w = antichain_search([d.start], successors, is_bad, lambda s: (None, s))
+    if counterexample:
+        return w
+    return w is None
+
+def intersect(*ms, trim=False):
+    """Intersect two or more Machines.
+
+    All the machines should have a state as store 0 and input STREAM
+    as store 1. For example, 
+
+    - They can be finite automata, in which case this is the standard
       product construction.
 
     - One can be an NFA and the other a PDA, in which case the result
       is a PDA.
 
     - The intersection of two PDAs would be a two-stack PDA.
-    """
 
-    def make_tuple(*xs):
-        return syntax.Tuple(xs)
+    Only the tuples of states that are reachable from the start state
+    are constructed, so intersecting several machines at once is
+    usually much cheaper than intersecting them two at a time.
+
+    Arguments:
+        ms (Machine): the machines to intersect
+        trim (bool): if True, also remove states from which no accept
+          state can be reached (considering only the states, not the
+          other stores).
+    """
 
     def is_finite_plus(m):
         return (m.store_types[:2] == (machines.BASE, machines.STREAM) and
                 m.state == 0 and m.has_cell(0) and
                 m.input == 1 and m.has_input_stream(1))
 
-    if not is_finite_plus(m1):
-        raise ValueError("m1 must have a state and input stream")
-    if not is_finite_plus(m2):
-        raise ValueError("m2 must have a state and input stream")
-    for t1 in m1.transitions:
-        if len(t1.lhs[1]) > 1:
-            raise ValueError('m1 cannot have multiple input symbols on a transition')
-    for t2 in m2.transitions:
-        if len(t2.lhs[1]) > 1:
-            raise ValueError('m2 cannot have multiple input symbols on a transition')
-
-    store_types = ((machines.BASE, machines.STREAM) +
-                   m1.store_types[2:] + m2.store_types[2:])
+    if len(ms) < 2:
+        raise TypeError("intersect needs at least two machines")
+    for i, mi in enumerate(ms):
+        if not is_finite_plus(mi):
+            raise ValueError(f"m{i+1} must have a state and input stream")
+        for t in mi.transitions:
+            if len(t.lhs[1]) > 1:
+                raise ValueError(f'm{i+1} cannot have multiple input symbols on a transition')
 
+    store_types = (machines.BASE, machines.STREAM)
+    for mi in ms:
+        store_types += mi.store_types[2:]
     m = machines.Machine(store_types, state=0, input=1)
+    n = len(ms)
+    empty = [tuple(machines.Store() for _ in mi.store_types[2:]) for mi in ms]
 
-    m.start_config = machines.Configuration(
-        ([make_tuple(m1.start_config[0][0], m2.start_config[0][0])], []) +
-        m1.start_config[2:] + m2.start_config[2:]
-    )
+    # For each machine, index its transitions by state and input symbol
+    # (None for epsilon transitions).
+    index = []
+    for mi in ms:
+        index_i = collections.defaultdict(lambda: collections.defaultdict(list))
+        for t in mi.transitions:
+            a = t.lhs[1][0] if len(t.lhs[1]) > 0 else None
+            index_i[t.lhs[0][0]][a].append(t)
+        index.append(index_i)
 
+    names = {}
+    def name(qs):
+        if qs not in names:
+            names[qs] = syntax.Symbol(syntax.Tuple(qs))
+        return names[qs]
 
-    for c1 in m1.accept_configs:
-        for c2 in m2.accept_configs:
-            m.accept_configs.add(machines.Configuration(
-                ([make_tuple(c1[0][0], c2[0][0])], [syntax.BLANK]) + c1[2:] + c2[2:]
-            ))
-            
-    for t1 in m1.transitions:
-        for t2 in m2.transitions:
-            if t1.lhs[1] == t2.lhs[1] and len(t1.lhs[1]) > 0:
-                m.transitions.append(machines.Transition(
-                    ([make_tuple(t1.lhs[0][0], t2.lhs[0][0])], t1.lhs[1]) + t1.lhs[2:] + t2.lhs[2:],
-                    ([make_tuple(t1.rhs[0][0], t2.rhs[0][0])], []) + t1.lhs[2:] + t2.lhs[2:],
-                ))
+    start = tuple(mi.start_config[0][0] for mi in ms)
+    name(start)
+    agenda = [start]
+    edges = []
+    while len(agenda) > 0:
+        qs = agenda.pop()
+        succ = []
 
-    # Handle epsilon transitions. For stores 2 and beyond, we just use
-    # a lhs and rhs of &, whether or not this makes sense for the type
-    # of automaton that m1 and m2 are.
-    for t1 in m1.transitions:
-        if len(t1.lhs[1]) == 0:
-            for q2 in m2.states:
-                m.transitions.append(machines.Transition(
-                    ([make_tuple(t1.lhs[0][0], q2)], []) + ([],)*(m.num_stores-2),
-                    ([make_tuple(t1.rhs[0][0], q2)], []) + ([],)*(m.num_stores-2)
-                ))
+        # Transitions that read a symbol: every machine reads it
+        symbols = set(index[0][qs[0]])
+        symbols.discard(None)
+        for i in range(1, n):
+            symbols.intersection_update(index[i][qs[i]])
+        for a in symbols:
+            for ts in itertools.product(*(index[i][qs[i]][a] for i in range(n))):
+                rs = tuple(t.rhs[0][0] for t in ts)
+                succ.append((ts[0].lhs[1],
+                             sum((t.lhs[2:] for t in ts), ()),
+                             sum((t.rhs[2:] for t in ts), ()),
+                             rs))
 
-    for t2 in m2.transitions:
-        if len(t2.lhs[1]) == 0:
-            for q1 in m1.states:
-                m.transitions.append(machines.Transition(
-                    ([make_tuple(q1, t2.lhs[0][0])], []) + ([],)*(m.num_stores-2),
-                    ([make_tuple(q1, t2.rhs[0][0])], []) + ([],)*(m.num_stores-2)
-                ))
+        # Epsilon transitions: one machine moves
+        for i in range(n):
+            for t in index[i][qs[i]].get(None, []):
+                rs = qs[:i] + (t.rhs[0][0],) + qs[i+1:]
+                succ.append((t.lhs[1],
+                             sum(empty[:i], ()) + t.lhs[2:] + sum(empty[i+1:], ()),
+                             sum(empty[:i], ()) + t.rhs[2:] + sum(empty[i+1:], ()),
+                             rs))
+
+        for lhs_input, lhs_rest, rhs_rest, rs in succ:
+            if rs not in names:
+                name(rs)
+                agenda.append(rs)
+            edges.append((qs, rs,
+                          ([name(qs)], lhs_input) + lhs_rest,
+                          ([name(rs)], []) + rhs_rest))
+
+    # Accept configurations of each machine, indexed by state
+    accept = []
+    for mi in ms:
+        accept_i = collections.defaultdict(list)
+        for c in mi.accept_configs:
+            accept_i[c[0][0]].append(c)
+        accept.append(accept_i)
+    final = [qs for qs in names if all(qs[i] in accept[i] for i in range(n))]
 
+    keep = names
+    if trim:
+        backward = collections.defaultdict(list)
+        for qs, rs, _, _ in edges:
+            backward[rs].append(qs)
+        keep = set(final)
+        agenda = list(final)
+        while len(agenda) > 0:
+            rs = agenda.pop()
+            for qs in backward[rs]:
+                if qs not in keep:
+                    keep.add(qs)
+                    agenda.append(qs)
+
+    m.start_config = machines.Configuration(
+        ([name(start)], []) + sum((mi.start_config[2:] for mi in ms), ())
+    )
+    for qs in final:
+        if qs in keep:
+            for cs in itertools.product(*(accept[i][qs[i]] for i in range(n))):
+                m.accept_configs.add(machines.Configuration(
+                    ([name(qs)], [syntax.BLANK]) + sum((c[2:] for c in cs), ())
+                ))
+    m.transitions.extend(machines.Transition(lhs, rhs) for qs, rs, lhs, rhs in edges
+                         if qs in keep and rs in keep)
     return m
 
 def prefix(m):
@@ -206,18 +1258,10 @@ def prefix(m):
     """
     if not m.is_finite():
         raise ValueError('m must be a finite automaton')
-    f = set(m.get_accept_states())
-    size = None
-    while len(f) != size:
-        size = len(f)
-        for t in m.get_transitions():
-            [[q], [a]], [[r]] = t.lhs, t.rhs
-            if r in f:
-                f.add(q)
+    f = coreachable_states(m)
     mp = machines.FiniteAutomaton()
     mp.set_start_state(m.get_start_state())
-    for t in m.get_transitions():
-        mp.add_transition(t)
+    mp.add_transitions(m.get_transitions())
     mp.add_accept_states(f)
     return mp
 
@@ -1,8 +1,14 @@
+import collections
+import functools
+import heapq
+import weakref
 from . import machines
 from . import syntax
 from . import graphs
+from . import operations
+from .operations import bits
 
-__all__ = ['from_regexp', 'to_regexp', 'RegularExpression']
+__all__ = ['from_regexp', 'to_regexp', 'to_dfa', 'RegularExpression', 'compile_many', 'Scanner']
 
 ### Regular expression objects
 
@@ -11,7 +17,7 @@ STAR = syntax.Operator('*')
 LPAREN = syntax.Operator('(')
 RPAREN = syntax.Operator(')')
 
-class RegularExpression:
+class RegularExpression(syntax.Frozen):
     """A (abstract syntax tree of a) regular expression.
 
     Arguments:
@@ -22,50 +28,314 @@ class RegularExpression:
     The empty string is represented as RegularExpression('concatenation', ()).
 
     The empty set is represented as RegularExpression('union', ()).
+
+    Regular expressions are immutable and hash-consed: constructing a
+    regular expression that is equal to one that already exists
+    returns the existing object. So equality tests are usually just
+    identity tests, and information computed about a regular
+    expression (like its derivatives) is shared by all its occurrences.
+
+    The parser and the other operations in this module build
+    expressions using constructors that flatten nested unions and
+    concatenations and drop duplicate alternatives of a union. So
+    `a|b|a` is parsed as `a|b`, and `a|a` is parsed (and printed) as
+    just `a`.
     """
-    def __init__(self, op, args, start=None, end=None):
-        self.op = op
-        self.args = tuple(args)
-        self.start = start
-        self.end = end
 
+    __slots__ = ('op', 'args', '_nullable', '_derivatives', '_partial_derivatives', '_simplified')
+    _table: 'weakref.WeakValueDictionary[tuple, RegularExpression]' = weakref.WeakValueDictionary()
+
+    def __new__(cls, op, args):
+        args = tuple(args)
+        key = (op, args)
+        self = cls._table.get(key)
+        if self is None:
+            self = object.__new__(cls)
+            object.__setattr__(self, 'op', op)
+            object.__setattr__(self, 'args', args)
+            object.__setattr__(self, '_derivatives', {})
+            object.__setattr__(self, '_partial_derivatives', {})
+            cls._table[key] = self
+        return self
+
+    def _key(self):
+        return (self.op, self.args)
+
+    # Because of hash-consing, equal expressions are identical.
+    __hash__ = object.__hash__
     def __eq__(self, other):
-        return (isinstance(other, RegularExpression) and
-                self.op == other.op and
-                all(schild == ochild for schild, ochild in zip(self.args, other.args)))
+        return self is other
+    def __ne__(self, other):
+        return self is not other
 
-    def __str__(self, format='ascii'):
-        if self.op == 'union':
-            if len(self.args) > 0:
-                return (' '+UNION+' ').join(arg.__str__(format=format) for arg in self.args)
+    # Ordering is structural, as for other Frozen objects, but
+    # without recursion (see `compare`).
+    def __lt__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return compare(self, other) < 0
+    def __le__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return compare(self, other) <= 0
+    def __gt__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return compare(self, other) > 0
+    def __ge__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return compare(self, other) >= 0
+
+    def is_nullable(self):
+        """Returns True iff the empty string belongs to this regular expression."""
+        try:
+            return self._nullable
+        except AttributeError:
+            pass
+        def children(e):
+            return e.args if e.op in ['union', 'concatenation'] else ()
+        def compute(e):
+            if e.op == 'union':
+                value = any(arg._nullable for arg in e.args)
+            elif e.op == 'concatenation':
+                value = all(arg._nullable for arg in e.args)
             else:
-                return '∅'
-
-        elif self.op == 'concatenation':
-            if len(self.args) > 0:
-                args = []
-                for arg in self.args:
-                    s = arg.__str__(format=format)
-                    if arg.op == 'union':
-                        s = '('+s+')'
-                    args.append(s)
-                return ' '.join(args)
+                value = e.op == 'star'
+            object.__setattr__(e, '_nullable', value)
+        bottom_up(self, children, lambda e: hasattr(e, '_nullable'), compute)
+        return self._nullable
+
+    def derivative(self, a):
+        """Returns the Brzozowski derivative of this regular expression
+        with respect to symbol `a`, that is, a regular expression for
+        the set of strings w such that a w belongs to this one.
+
+        Unions in the result are normalized (flattened, sorted, and
+        without duplicates), so that a regular expression has only
+        finitely many different repeated derivatives. Derivatives are
+        cached, so repeatedly taking derivatives amounts to building a
+        DFA lazily, whose states are regular expressions.
+        """
+        try:
+            return self._derivatives[a]
+        except KeyError:
+            pass
+        def compute(e):
+            if e.op == 'symbol':
+                d = EPSILON if e.args[0] == a else EMPTYSET
+            elif e.op == 'union':
+                d = aci_union(arg._derivatives[a] for arg in e.args)
+            elif e.op == 'concatenation':
+                d = aci_union(concatenation((arg._derivatives[a],) + e.args[i+1:])
+                              for i, arg in enumerate(derivative_args(e)))
+            elif e.op == 'star':
+                [arg] = e.args
+                d = concatenation([arg._derivatives[a], e])
+            e._derivatives[a] = d
+        bottom_up(self, derivative_args, lambda e: a in e._derivatives, compute)
+        return self._derivatives[a]
+
+    def partial_derivatives(self, a):
+        """Returns the Antimirov partial derivatives of this regular
+        expression with respect to symbol `a`, a `frozenset` of regular
+        expressions whose union is the Brzozowski derivative."""
+        try:
+            return self._partial_derivatives[a]
+        except KeyError:
+            pass
+        def compute(e):
+            ds = set()
+            if e.op == 'symbol':
+                if e.args[0] == a:
+                    ds.add(EPSILON)
+            elif e.op == 'union':
+                for arg in e.args:
+                    ds.update(arg._partial_derivatives[a])
+            elif e.op == 'concatenation':
+                for i, arg in enumerate(derivative_args(e)):
+                    rest = e.args[i+1:]
+                    ds.update(concatenation((d,) + rest) for d in arg._partial_derivatives[a])
+            elif e.op == 'star':
+                [arg] = e.args
+                ds.update(concatenation([d, e]) for d in arg._partial_derivatives[a])
+            e._partial_derivatives[a] = frozenset(ds)
+        bottom_up(self, derivative_args, lambda e: a in e._partial_derivatives, compute)
+        return self._partial_derivatives[a]
+
+    def symbols(self):
+        """Returns the set of symbols occurring in this regular expression."""
+        result = set()
+        for e in subexpressions(self):
+            if e.op == 'symbol':
+                result.update(e.args)
+        return result
+
+    def simplify(self):
+        """Returns an equivalent regular expression that is (usually)
+        smaller. See `simplify`."""
+        return simplify(self)
+
+    def match(self, w):
+        """Tests whether string `w` belongs to this regular expression,
+        by taking a derivative for each symbol of `w`.
+
+        Arguments:
+            w (String or str): the string to test.
+        """
+        if isinstance(w, str):
+            w = syntax.String(w)
+        e = self
+        for a in w:
+            e = e.derivative(a)
+            if e is EMPTYSET:
+                return False
+        return e.is_nullable()
+
+    def search(self, w, all_starts=False):
+        """Finds the substrings of `w` that belong to this regular
+        expression. For each position j of `w` at which such a
+        substring ends, yields (i, j), where i is the leftmost position
+        at which one starts (so ``w[i:j]`` matches). If `all_starts`
+        is True, yields (i, j) for every such i, in increasing order.
+
+        This reads `w` only once, from left to right, so `w` can be an
+        arbitrarily long stream of symbols. It simulates the DFA for
+        Σ* e, whose state is the set of derivatives of e with respect
+        to the suffixes read so far, labelling each derivative with
+        the positions where it started. Two starts that lead to the
+        same derivative have the same future, so by default only the
+        leftmost is kept, and the memory used does not grow with the
+        length of `w`. With `all_starts`, every start is kept as long
+        as it can still lead to a match, so the memory used can grow
+        with the length of `w` (for example, for `(a|b)*`).
+
+        Arguments:
+            w (String, str, or iterable of symbols): the string to search
+            all_starts (bool): yield every start position, not just the leftmost
+
+        Yields:
+            pairs (i, j) of positions in `w`
+        """
+        if isinstance(w, str):
+            w = syntax.String(w)
+
+        # A configuration is a tuple of derivatives, in order of their
+        # leftmost start positions. For each configuration and symbol,
+        # we cache the next configuration, for each of its derivatives
+        # the indices of the derivatives it came from (None for a new
+        # start), and the indices of its nullable derivatives.
+        cache = {}
+        config = (self,)
+        starts = [[0]] if all_starts else [0]
+        if self.is_nullable():
+            yield (0, 0)
+        for j, a in enumerate(w, 1):
+            try:
+                config, sources, nullable = cache[config, a]
+            except KeyError:
+                key = config, a
+                ds = {}
+                for i, d in enumerate(config):
+                    ds.setdefault(d.derivative(a), []).append(i)
+                ds.pop(EMPTYSET, None)
+                ds.setdefault(self, []).append(None)
+                config = tuple(ds)
+                sources = tuple(map(tuple, ds.values()))
+                nullable = tuple(k for k, d in enumerate(config) if d.is_nullable())
+                cache[key] = config, sources, nullable
+            if all_starts:
+                starts = [[x for i in source for x in ([j] if i is None else starts[i])]
+                          for source in sources]
+                for i in sorted(x for k in nullable for x in starts[k]):
+                    yield (i, j)
             else:
-                return syntax.EPSILON
-
-        elif self.op == 'star':
-            [arg] = self.args
-            s = arg.__str__(format=format)
-            if arg.op != 'symbol':
-                s = '('+s+')'
-            return s+STAR
-
-        elif self.op == 'symbol':
-            [arg] = self.args
-            if format == 'html' and hasattr(arg, '_repr_html_'):
-                return arg._repr_html_()
+                starts = [j if source[0] is None else starts[source[0]] for source in sources]
+                if nullable:
+                    yield (starts[nullable[0]], j)
+
+    def __str__(self, format='ascii'):
+        # The stack holds subexpressions still to be printed and
+        # strings still to be output, in reverse order.
+        out = []
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            if isinstance(x, str):
+                out.append(x)
+                continue
+            items = []
+            if x.op == 'union':
+                if len(x.args) > 0:
+                    for i, arg in enumerate(x.args):
+                        if i > 0:
+                            items.append(' '+UNION+' ')
+                        items.append(arg)
+                else:
+                    items.append('∅')
+
+            elif x.op == 'concatenation':
+                if len(x.args) > 0:
+                    for i, arg in enumerate(x.args):
+                        if i > 0:
+                            items.append(' ')
+                        if arg.op == 'union':
+                            items.extend(['(', arg, ')'])
+                        else:
+                            items.append(arg)
+                else:
+                    items.append(syntax.EPSILON)
+
+            elif x.op == 'star':
+                [arg] = x.args
+                if arg.op != 'symbol':
+                    items.extend(['(', arg, ')'])
+                else:
+                    items.append(arg)
+                items.append(STAR)
+
+            elif x.op == 'symbol':
+                [arg] = x.args
+                if format == 'html' and hasattr(arg, '_repr_html_'):
+                    items.append(str(arg._repr_html_()))
+                else:
+                    items.append(str(arg))
+            stack.extend(reversed(items))
+        return ''.join(out)
+
+    def __repr__(self):
+        # Like syntax.Frozen.__repr__, but with an explicit stack.
+        out = []
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            if isinstance(x, str):
+                out.append(x)
+                continue
+            items = ['{}(op={!r}, args=('.format(self.__class__.__name__, x.op)]
+            if x.op == 'symbol':
+                items.append(repr(x.args[0]))
             else:
-                return str(arg)
+                for i, arg in enumerate(x.args):
+                    if i > 0:
+                        items.append(', ')
+                    items.append(arg)
+            items.append(',))' if len(x.args) == 1 else '))')
+            stack.extend(reversed(items))
+        return ''.join(out)
+
+    def __reduce__(self):
+        # Pickle as a list of nodes, children before parents, so that
+        # neither pickling nor unpickling recurses.
+        index = {}
+        nodes = []
+        def children(x):
+            return x.args if x.op != 'symbol' else ()
+        def compute(x):
+            index[x] = len(nodes)
+            nodes.append((x.op, x.args if x.op == 'symbol' else tuple(index[arg] for arg in x.args)))
+        bottom_up(self, children, index.__contains__, compute)
+        return (from_nodes, (nodes,))
 
     @classmethod
     def from_str(cls, s):
@@ -93,18 +363,124 @@ class RegularExpression:
     def _repr_html_(self):
         return self.__str__(format='html')
 
+def compare(e, f):
+    """Compares `e` and `f` structurally, returning a negative number,
+    zero, or a positive number if `e` is less than, equal to, or
+    greater than `f`. Expressions are ordered by their op, then by
+    their number of arguments, then by their arguments from left to
+    right. The order does not depend on when the expressions were
+    created, and comparing does not recurse.
+
+    Because expressions are hash-consed, two distinct expressions
+    differ structurally, so only the first pair of distinct arguments
+    needs to be compared.
+    """
+    while e is not f:
+        if e.op != f.op:
+            return -1 if e.op < f.op else 1
+        if len(e.args) != len(f.args):
+            return len(e.args) - len(f.args)
+        if e.op == 'symbol':
+            return -1 if e.args[0] < f.args[0] else 1
+        for x, y in zip(e.args, f.args):
+            if x is not y:
+                e, f = x, y
+                break
+    return 0
+
+compare_key = functools.cmp_to_key(compare)
+
+def bottom_up(e, children, done, compute):
+    """Calls `compute(x)` for `e` and its descendants `x` such that
+    `done(x)` is false, children before parents, where the children of
+    `x` are `children(x)`. After `compute(x)` is called, `done(x)`
+    should normally be true; if it is not, `x` is visited again, with
+    `children(x)` called again.
+
+    This uses an explicit stack, so that very deep expressions do not
+    exceed Python's recursion limit.
+    """
+    stack = [e]
+    while stack:
+        x = stack[-1]
+        if done(x):
+            stack.pop()
+            continue
+        pending = [c for c in children(x) if not done(c)]
+        if pending:
+            stack.extend(reversed(pending))
+        else:
+            compute(x)
+
+def from_nodes(nodes):
+    """Inverse of `RegularExpression.__reduce__`."""
+    exprs = []
+    for op, args in nodes:
+        exprs.append(RegularExpression(op, args if op == 'symbol' else [exprs[i] for i in args]))
+    return exprs[-1]
+
+def subexpressions(e):
+    """Iterates over the distinct subexpressions of `e`, including `e`."""
+    visited = {e}
+    stack = [e]
+    while stack:
+        x = stack.pop()
+        yield x
+        if x.op != 'symbol':
+            for arg in x.args:
+                if arg not in visited:
+                    visited.add(arg)
+                    stack.append(arg)
+
+def derivative_args(e):
+    """The arguments of `e` whose derivatives are needed to compute the
+    derivative of `e`."""
+    if e.op == 'concatenation':
+        for i, arg in enumerate(e.args):
+            if not arg.is_nullable():
+                return e.args[:i+1]
+        return e.args
+    elif e.op == 'symbol':
+        return ()
+    else:
+        return e.args
+
 def union(args):
+    """The union of `args`. Nested unions are flattened and duplicate
+    arguments are dropped, keeping the first occurrence, so the result
+    can print differently from its arguments: the union of `a` and
+    `a` is just `a`."""
     newargs = []
     for arg in args:
         if arg.op == 'union':
             newargs.extend(arg.args)
         else:
             newargs.append(arg)
+    newargs = list(dict.fromkeys(newargs))
     if len(newargs) == 1:
         return newargs[0]
     else:
         return RegularExpression('union', newargs)
 
+def aci_union(args):
+    """Like `union`, but also sorts its arguments, so that unions that
+    are equal modulo associativity, commutativity, and idempotence are
+    represented by the same object.
+
+    The arguments are sorted structurally (see `compare`), so the
+    result does not depend on which expressions were created first."""
+    newargs = set()
+    for arg in args:
+        if arg.op == 'union':
+            newargs.update(arg.args)
+        else:
+            newargs.add(arg)
+    if len(newargs) == 1:
+        [arg] = newargs
+        return arg
+    else:
+        return RegularExpression('union', sorted(newargs, key=compare_key))
+
 def concatenation(args):
     newargs = []
     for arg in args:
@@ -120,156 +496,697 @@ def concatenation(args):
         return RegularExpression('concatenation', newargs)
 
 def star(arg):
-    if arg in ['union', 'concatenation'] and len(arg.args) == 0:
+    if arg.op in ['union', 'concatenation'] and len(arg.args) == 0:
         return concatenation([])
+    elif arg.op == 'star':
+        return arg
     else:
         return RegularExpression('star', [arg])
 
 def symbol(arg):
     return RegularExpression('symbol', [arg])
 
+EPSILON = concatenation([])
+EMPTYSET = union([])
+
+### Simplification
+
+def simplify(e):
+    """Simplify regular expression `e` by applying the following rewrite
+    rules bottom-up:
+
+    - ∅* = ε* = ε, (r*)* = r*, (ε ∪ r)* = r*, (r* ∪ s)* = (r ∪ s)*, and
+      (r s)* = (r ∪ s)* if r and s are both nullable.
+    - r* r* = r*.
+    - ε ∪ r r* = ε ∪ r* r = r*.
+    - r s ∪ r t = r (s ∪ t) and s r ∪ t r = (s ∪ t) r.
+    - r ∪ s = s if r is subsumed by s (see `subsumes`).
+
+    The result is cached, so simplifying an expression a second time,
+    or an expression containing an already-simplified subexpression,
+    is fast.
+    """
+    try:
+        return e._simplified
+    except AttributeError:
+        pass
+    # If a rule produces an expression that needs further
+    # simplification, x is simplified to whatever that expression
+    # simplifies to. Doing this through bottom_up (rather than calling
+    # simplify recursively) keeps the Python stack shallow.
+    redirects = {}
+    def children(x):
+        if x in redirects:
+            return [redirects[x]]
+        return x.args if x.op != 'symbol' else ()
+    def compute(x):
+        if x in redirects:
+            result = redirects.pop(x)._simplified
+        else:
+            if x.op == 'symbol':
+                result, final = x, True
+            elif x.op == 'star':
+                result, final = simplify_star(x.args[0]._simplified)
+            elif x.op == 'concatenation':
+                result, final = simplify_concatenation([arg._simplified for arg in x.args])
+            elif x.op == 'union':
+                result, final = simplify_union([arg._simplified for arg in x.args])
+            if not final:
+                redirects[x] = result
+                return
+        object.__setattr__(x, '_simplified', result)
+        if result is not x:
+            object.__setattr__(result, '_simplified', result)
+    bottom_up(e, children, lambda x: hasattr(x, '_simplified'), compute)
+    return e._simplified
+
+# The following functions take simplified arguments and return a pair
+# (r, final), where r is equivalent to the expression built from the
+# arguments, and final is False if r needs further simplification.
+
+def simplify_star(arg):
+    if arg.op == 'star':
+        return arg, True
+    if arg.op == 'concatenation' and arg.is_nullable():
+        arg = union(arg.args)
+    if arg.op == 'union':
+        args = [a.args[0] if a.op == 'star' else a for a in arg.args if a is not EPSILON]
+        if args != list(arg.args):
+            return star(union(args)), False
+    return star(arg), True
+
+def simplify_concatenation(args):
+    e = concatenation(args)
+    if e.op != 'concatenation':
+        # ∅, or a single argument, which is already simplified
+        return e, True
+    newargs = []
+    for arg in e.args:
+        if arg.op == 'star' and newargs and newargs[-1] is arg:
+            continue
+        newargs.append(arg)
+    result = concatenation(newargs)
+    return result, result is e
+
+def common_prefix(seqs):
+    """Returns the length of the longest common prefix of `seqs`."""
+    k = 0
+    for xs in zip(*seqs):
+        if any(x is not xs[0] for x in xs):
+            break
+        k += 1
+    return k
+
+def simplify_union(args):
+    e = union(args)
+    if e.op != 'union':
+        return e, True
+    args = list(e.args)
+
+    # ε ∪ r r* = ε ∪ r* r = r*
+    if EPSILON in args:
+        for i, arg in enumerate(args):
+            if arg.op != 'concatenation' or len(arg.args) < 2:
+                continue
+            first, last = arg.args[0], arg.args[-1]
+            if last.op == 'star' and concatenation(arg.args[:-1]) is last.args[0]:
+                args[i] = last
+            elif first.op == 'star' and concatenation(arg.args[1:]) is first.args[0]:
+                args[i] = first
+            else:
+                continue
+            args.remove(EPSILON)
+            return union(args), False
+
+    # Remove subsumed arguments
+    keep = list(args)
+    for arg in args:
+        if any(other is not arg and subsumes(other, arg) for other in keep):
+            keep.remove(arg)
+    if len(keep) < len(args):
+        return union(keep), False
+
+    # Factor out common prefixes, then common suffixes. The whole
+    # common prefix (suffix) of each group is factored out at once.
+    for reverse in [False, True]:
+        groups = {}
+        for arg in args:
+            seq = arg.args if arg.op == 'concatenation' else (arg,)
+            if reverse:
+                seq = seq[::-1]
+            groups.setdefault(seq[0] if seq else None, []).append(seq)
+        if len(groups) < len(args):
+            newargs = []
+            for seqs in groups.values():
+                if len(seqs) == 1:
+                    seq = seqs[0]
+                else:
+                    k = common_prefix(seqs)
+                    rest = union(concatenation(seq[k:][::-1] if reverse else seq[k:]) for seq in seqs)
+                    seq = seqs[0][:k] + (rest,)
+                newargs.append(concatenation(seq[::-1] if reverse else seq))
+            return union(newargs), False
+
+    return e, True
+
+def subsumes(e, f, depth=50):
+    """Returns True if `e` is known to contain every string in `f`. This
+    test is syntactic and conservative: it may return False even if
+    `e` does contain every string in `f`, and it gives up (returning
+    False) on subexpressions nested more than `depth` levels deep."""
+    if e is f or f is EMPTYSET:
+        return True
+    if f is EPSILON:
+        return e.is_nullable()
+    if depth == 0:
+        return False
+    depth -= 1
+    if f.op == 'union':
+        return all(subsumes(e, arg, depth) for arg in f.args)
+    if e.op == 'union':
+        return any(subsumes(arg, f, depth) for arg in e.args)
+    if e.op == 'star':
+        if f.op == 'star':
+            return subsumes(e, f.args[0], depth)
+        if f.op == 'concatenation' and all(subsumes(e, arg, depth) for arg in f.args):
+            return True
+        return subsumes(e.args[0], f, depth)
+    if e.op == 'concatenation' and f.op == 'concatenation' and len(e.args) == len(f.args):
+        return all(subsumes(x, y, depth) for x, y in zip(e.args, f.args))
+    return False
+
+### Equivalence
+
+def equivalent(e1, e2, counterexample=False):
+    """Test whether two regular expressions are equivalent, using the
+    Hopcroft-Karp algorithm on their derivatives.
+
+    No automaton is built: the states are the repeated derivatives of
+    `e1` and `e2` (see `RegularExpression.derivative`), which are
+    computed only as needed and cached. Because expressions are
+    hash-consed, a derivative of `e1` that is identical to a
+    derivative of `e2` is the same state, which often ends the search
+    early.
+
+    Arguments:
+        e1, e2 (RegularExpression or str): regular expressions
+        counterexample (bool): if True, return a shortest string
+          that matches one expression but not the other, or None if
+          they are equivalent.
+
+    Returns:
+        bool, or String or None if `counterexample` is True.
+    """
+    if isinstance(e1, str):
+        e1 = str_to_regexp(e1)
+    if isinstance(e2, str):
+        e2 = str_to_regexp(e2)
+    alphabet = sorted(e1.symbols() | e2.symbols())
+
+    # Each agenda item has a pointer to the item it was reached from,
+    # so the string leading to it can be recovered.
+    u = operations.UnionFind()
+    u.union(e1, e2)
+    agenda = collections.deque()
+    item = (e1, e2, None, None)
+
+    while True:
+        f1, f2, _, _ = item
+        if f1.is_nullable() != f2.is_nullable():
+            if not counterexample:
+                return False
+            w = []
+            while item[2] is not None:
+                w.append(item[3])
+                item = item[2]
+            return syntax.String(w[::-1])
+        for a in alphabet:
+            g1 = f1.derivative(a)
+            g2 = f2.derivative(a)
+            if u.union(g1, g2):
+                agenda.append((g1, g2, item, a))
+        if len(agenda) == 0:
+            break
+        item = agenda.popleft()
+    return None if counterexample else True
+
 ### Parser for regular expressions
 
 def str_to_regexp(s):
+    """Parses a regular expression. The parser is iterative, using an
+    explicit stack of open parentheses, so that very long or deeply
+    nested expressions do not exceed Python's recursion limit."""
     s = syntax.lexer(s)
-    r = parse_union(s)
+    nothing = "expected symbol, found nothing (use ε or & for the empty string)"
+
+    # Each group (the top level, or an open parenthesis) is a pair of
+    # the finished alternatives of a union and the items of the
+    # current concatenation.
+    groups = [([], [])]
+    starrable = False # whether the previous token ended a base expression
+    while s.pos < len(s):
+        tok = s.cur
+        alts, items = groups[-1]
+        if tok == LPAREN:
+            groups.append(([], []))
+            starrable = False
+        elif tok == RPAREN:
+            if len(items) == 0:
+                raise ValueError(nothing)
+            if len(groups) == 1:
+                break
+            alts.append(concatenation(items))
+            groups.pop()
+            groups[-1][1].append(union(alts))
+            starrable = True
+        elif tok == UNION:
+            if len(items) == 0:
+                raise ValueError(nothing)
+            alts.append(concatenation(items))
+            items.clear()
+            starrable = False
+        elif tok == STAR and starrable:
+            items[-1] = star(items[-1])
+            starrable = False
+        elif tok == syntax.EPSILON:
+            items.append(concatenation([]))
+            starrable = True
+        elif tok == syntax.EMPTYSET:
+            items.append(union([]))
+            starrable = True
+        else:
+            items.append(symbol(syntax.parse_symbol(s)))
+            starrable = True
+            continue
+        s.pos += 1
+
+    alts, items = groups[-1]
+    if len(items) == 0:
+        raise ValueError(nothing)
+    if len(groups) > 1:
+        raise ValueError(f"expected {RPAREN}, found end of string")
     if s.pos < len(s):
         raise ValueError("unexpected characters {} after regular expression".format(s[s.pos:]))
-    return r
-
-def parse_union(s):
-    i = s.pos
-    args = [parse_concatenation(s)]
-    while s.pos < len(s) and s.cur == UNION:
-        syntax.parse_character(s, UNION)
-        args.append(parse_concatenation(s))
-    return union(args)
-
-def parse_concatenation(s):
-    args = [parse_star(s)]
-    while s.pos < len(s) and s.cur not in [UNION, RPAREN]:
-        args.append(parse_star(s))
-    return concatenation(args)
-
-def parse_star(s):
-    i = s.pos
-    arg = parse_base(s)
-    if s.pos < len(s) and s.cur == STAR:
-        syntax.parse_character(s, STAR)
-        return star(arg)
-    else:
-        return arg
-
-def parse_base(s):
-    if s.pos < len(s) and s.cur == LPAREN:
-        syntax.parse_character(s, LPAREN)
-        e = parse_union(s)
-        syntax.parse_character(s, RPAREN)
-        return e
-    elif s.pos == len(s) or s.cur in [UNION, RPAREN]:
-        raise ValueError("expected symbol, found nothing (use ε or & for the empty string)")
-    elif s.pos < len(s) and s.cur == syntax.EPSILON:
-        syntax.parse_character(s, syntax.EPSILON)
-        return concatenation([])
-    elif s.pos < len(s) and s.cur == syntax.EMPTYSET:
-        syntax.parse_character(s, syntax.EMPTYSET)
-        return union([])
-    elif s.pos < len(s):
-        a = syntax.parse_symbol(s)
-        return symbol(a)
-    else:
-        assert False
+    alts.append(concatenation(items))
+    return union(alts)
 
-def from_regexp(e, display_steps=False):
+def from_regexp(e, display_steps=False, method="thompson", simplify=False):
     """Convert a regular expression to a NFA.
 
     Arguments:
         e (RegularExpression or str): the regular expression to convert.
         display_steps (bool): if True and if run inside a Jupyter notebook,
           displays all steps of the conversion.
+        method (str): selects which algorithm to use. Possible values are:
+
+          - ``"thompson"``: builds a NFA for each subexpression and joins
+            them with epsilon transitions, as in Sipser (3e) Lemma 1.55.
+          - ``"glushkov"``: builds the position automaton, which has no
+            epsilon transitions and one state for each occurrence of a
+            symbol, plus a start state.
+          - ``"antimirov"``: builds the partial derivative automaton,
+            which has no epsilon transitions and at most as many states
+            as the position automaton, often fewer.
+        simplify (bool): if True, simplify `e` (see `RegularExpression.simplify`)
+          before converting it.
     """
-    def count(e):
+    if isinstance(e, str):
+        e = str_to_regexp(e)
+    if simplify:
+        e = e.simplify()
+    if method == "thompson":
+        return from_regexp_thompson(e, display_steps)
+    elif method == "glushkov":
+        return from_regexp_glushkov(e, display_steps)
+    elif method == "antimirov":
+        return from_regexp_antimirov(e, display_steps)
+    else:
+        raise ValueError("unknown method '{}'".format(method))
+
+def from_regexp_thompson(e, display_steps=False):
+    def count(x):
         """Predetermine number of states we will need."""
-        if e.op == 'union':
-            return 1+sum(count(arg) for arg in e.args)
-        elif e.op == 'concatenation':
-            return sum(count(arg) for arg in e.args)
-        elif e.op == 'star':
-            return 1+count(e.args[0])
-        elif e.op == 'symbol':
-            return 2
+        if x.op == 'union':
+            counts[x] = 1+sum(counts[arg] for arg in x.args)
+        elif x.op == 'concatenation':
+            counts[x] = sum(counts[arg] for arg in x.args)
+        elif x.op == 'star':
+            counts[x] = 1+counts[x.args[0]]
+        elif x.op == 'symbol':
+            counts[x] = 2
 
     def zero_pad(i):
         return str(i).zfill(len(str(num_states)))
 
-    def visit(e, i):
-        m = machines.FiniteAutomaton()
+    if display_steps:
+        from IPython.display import display, HTML # type: ignore
+    counts = {}
+    bottom_up(e, lambda x: x.args if x.op != 'symbol' else (), counts.__contains__, count)
+    num_states = counts[e]
 
-        if e.op == 'symbol':
+    # Subexpressions are visited in postorder using an explicit stack.
+    # Each frame holds a subexpression, the index of its next argument
+    # to visit, the number of transitions before it was visited, and
+    # the start and accept states of the NFAs for its arguments.
+    transitions = []
+    i = 1
+    stack = [[e, 0, 0, []]]
+    while stack:
+        frame = stack[-1]
+        x, j, lo, margs = frame
+        if x.op != 'symbol' and j < len(x.args):
+            frame[1] += 1
+            stack.append([x.args[j], 0, len(transitions), []])
+            continue
+        stack.pop()
+
+        if x.op == 'symbol':
             start = "q" + zero_pad(i)
             accept = "q" + zero_pad(i+1)
             i += 2
-            m.set_start_state(start)
-            m.add_accept_state(accept)
-            m.add_transition((start, e.args[0]), (accept,))
+            transitions.append(((start, x.args[0]), (accept,)))
+            accepts = [accept]
 
-        elif e.op == 'concatenation' and len(e.args) == 0: # empty string
+        elif x.op == 'concatenation' and len(x.args) == 0: # empty string
             start = "q" + zero_pad(i)
             i += 1
-            m.set_start_state(start)
-            m.add_accept_state(start)
+            accepts = [start]
+
+        elif x.op == 'union':
+            start = "q" + zero_pad(i)
+            i += 1
+            accepts = []
+            for start1, accepts1 in margs:
+                transitions.append(((start, []), (start1,)))
+                accepts.extend(accepts1)
+
+        elif x.op == 'concatenation':
+            start = margs[0][0]
+            for (_, accepts1), (start2, _) in zip(margs, margs[1:]):
+                for q in accepts1:
+                    transitions.append(((q, []), (start2,)))
+            accepts = margs[-1][1]
+
+        elif x.op == 'star':
+            start = "q" + zero_pad(i)
+            i += 1
+            [(start1, accepts1)] = margs
+            transitions.append(((start, []), (start1,)))
+            for q in accepts1:
+                transitions.append(((q, []), (start1,)))
+            accepts = [start] + accepts1
 
         else:
-            margs = []
-            for arg in e.args:
-                marg, i = visit(arg, i)
-                m.transitions.extend(marg.transitions)
-                margs.append(marg)
+            assert False
 
-            if e.op == 'union':
-                start = "q" + zero_pad(i)
-                i += 1
-                m.set_start_state(start)
-                for marg in margs:
-                    m.add_transition((start, []), (marg.get_start_state(),))
-                    for q in marg.get_accept_states():
-                        m.add_accept_state(q)
+        if display_steps:
+            msub = machines.FiniteAutomaton()
+            msub.set_start_state(start)
+            msub.add_accept_states(accepts)
+            msub.add_transitions(transitions[lo:])
+            display(HTML('subexpression: '+x._repr_html_()))
+            display(msub)
 
-            elif e.op == 'concatenation':
-                m.set_start_state(margs[0].get_start_state())
-                for j in range(len(margs)-1):
-                    for q in margs[j].get_accept_states():
-                        m.add_transition((q, []), (margs[j+1].get_start_state(),))
-                for q in margs[-1].get_accept_states():
-                    m.add_accept_state(q)
+        if stack:
+            stack[-1][3].append((start, accepts))
 
-            elif e.op == 'star':
-                start = "q" + zero_pad(i)
-                i += 1
-                m.set_start_state(start)
-                m.add_accept_state(start)
-                start1 = margs[0].get_start_state()
-                m.add_transition((start, []), (start1,))
-                for q in margs[0].get_accept_states():
-                    m.add_transition((q, []), (start1,))
-                    m.add_accept_state(q)
+    m = machines.FiniteAutomaton()
+    m.set_start_state(start)
+    m.add_accept_states(accepts)
+    m.add_transitions(transitions)
+    return m
+
+class Positions:
+    """The positions (occurrences of symbols) of a regular expression,
+    numbered from 1, with the information needed to build automata
+    from them, as in McNaughton and Yamada's and Glushkov's
+    constructions. Sets of positions are represented as bitsets.
+
+    Attributes:
+        symbols: `symbols[p]` is the symbol at position p (p > 0)
+        follow: `follow[p]` is the set of positions that can come
+          right after position p in a match; `follow[0]` is the set of
+          positions that can start a match
+        last: the set of positions that can end a match, including 0
+          if the regular expression matches the empty string
+    """
+    def __init__(self, e):
+        self.symbols = [None]
+        self.follow = [0]
+        nullable, first, last = self._visit(e)
+        self.follow[0] = first
+        self.last = last | 1 if nullable else last
 
+    def _visit(self, e):
+        """Returns whether e matches the empty string, the positions
+        that can start a match of e, and the positions that can end
+        one."""
+        follow = self.follow
+        # Subexpressions are visited in postorder using an explicit
+        # stack. Each frame holds a subexpression, the index of its
+        # next argument to visit, and the results so far.
+        stack = [[e, 0, e.op != 'union', 0, 0]]
+        while True:
+            frame = stack[-1]
+            x, i, nullable, first, last = frame
+
+            if i > 0:
+                # Combine with the result for argument i-1
+                n, f, l = result
+                if x.op == 'union':
+                    nullable = nullable or n
+                    first |= f
+                    last |= l
+                elif x.op == 'concatenation':
+                    for p in bits(last):
+                        follow[p] |= f
+                    if nullable:
+                        first |= f
+                    last = last | l if n else l
+                    nullable = nullable and n
+                elif x.op == 'star':
+                    for p in bits(l):
+                        follow[p] |= f
+                    nullable, first, last = True, f, l
+                else:
+                    assert False
+
+            if x.op == 'symbol':
+                p = len(self.symbols)
+                self.symbols.append(x.args[0])
+                follow.append(0)
+                result = False, 1 << p, 1 << p
+            elif i < len(x.args):
+                frame[1:] = [i+1, nullable, first, last]
+                arg = x.args[i]
+                stack.append([arg, 0, arg.op != 'union', 0, 0])
+                continue
             else:
-                assert False
+                result = nullable, first, last
 
-        if display_steps:
-            display(HTML('subexpression: '+e._repr_html_()))
-            display(m)
+            stack.pop()
+            if not stack:
+                return result
 
-        return m, i
+def from_regexp_glushkov(e, display_steps=False):
+    pos = Positions(e)
+    m = machines.FiniteAutomaton()
+    m.set_start_state('0')
+    m.add_transitions(((str(p), pos.symbols[q]), (str(q),))
+                      for p in range(len(pos.symbols))
+                      for q in bits(pos.follow[p]))
+    m.add_accept_states(str(p) for p in bits(pos.last))
 
     if display_steps:
-        from IPython.display import display, HTML # type: ignore
+        from IPython.display import display # type: ignore
+        display(m)
+    return m
+
+def from_regexp_antimirov(e, display_steps=False):
+    alphabet = sorted(e.symbols())
+    index = {e: 0}
+    order = [e]
+    m = machines.FiniteAutomaton()
+    m.set_start_state('0')
+    transitions = []
+    for q in order:
+        for a in alphabet:
+            for r in sorted(q.partial_derivatives(a), key=compare_key):
+                if r not in index:
+                    index[r] = len(order)
+                    order.append(r)
+                transitions.append(((str(index[q]), a), (str(index[r]),)))
+    m.add_transitions(transitions)
+    m.add_accept_states(str(i) for i, q in enumerate(order) if q.is_nullable())
+
+    if display_steps:
+        from IPython.display import display # type: ignore
+        display(m)
+    return m
+
+def to_dfa(e, lazy=False, simplify=False):
+    """Convert a regular expression directly to a DFA, without building
+    a NFA first.
+
+    Each state of the DFA is a set of positions of `e` (see `Positions`),
+    named like `{1,3}`; the start state is `{0}`. As with
+    `operations.determinize`, the DFA is complete, so it may include
+    the empty set as a state.
+
+    Arguments:
+        e (RegularExpression or str): the regular expression to convert.
+        lazy (bool): if True, return a `operations.LazyDFA` whose states are
+          constructed only when they are visited.
+        simplify (bool): if True, simplify `e` (see `RegularExpression.simplify`)
+          before converting it; the positions are then those of the
+          simplified expression.
+    """
     if isinstance(e, str):
         e = str_to_regexp(e)
-    num_states = count(e)
-    m, _ = visit(e, 1)
-    return m
+    if simplify:
+        e = e.simplify()
+    if lazy:
+        return operations.LazyDFA(from_regexp_glushkov(e))
+
+    pos = Positions(e)
+    alphabet = sorted(set(pos.symbols[1:]))
+    mask = {a: 0 for a in alphabet}
+    for p in range(1, len(pos.symbols)):
+        mask[pos.symbols[p]] |= 1 << p
+
+    # The states are numbered in the order they are discovered.
+    ids = {1: 0}
+    subsets = [1]
+    delta = []
+    i = 0
+    while i < len(subsets):
+        follow = 0
+        for p in bits(subsets[i]):
+            follow |= pos.follow[p]
+        delta_i = {}
+        for a in alphabet:
+            s = follow & mask[a]
+            if s not in ids:
+                ids[s] = len(subsets)
+                subsets.append(s)
+            delta_i[a] = ids[s]
+        delta.append(delta_i)
+        i += 1
+
+    names = [syntax.Symbol(syntax.Set(str(p) for p in bits(s))) for s in subsets]
+    return operations.IndexedDFA(names, alphabet, delta, 0,
+                                 {i for i, s in enumerate(subsets) if s & pos.last}).to_machine()
+
+### Matching several regular expressions at once
+
+def compile_many(es):
+    """Combine regular expressions `es` into a `Scanner`, which tests
+    all of them at once in a single pass over a string.
+
+    Arguments:
+        es (list of RegularExpression or str): the patterns, numbered
+          from 0 in the order given. When more than one pattern matches
+          the same token, the lowest-numbered pattern has priority.
+    """
+    return Scanner(es)
+
+class Scanner:
+    """A DFA that runs several regular expressions in parallel (see
+    `compile_many`), whose states and transitions are constructed only
+    when they are needed.
+
+    Each state is numbered and corresponds to a tuple with the
+    derivative of each pattern (see `RegularExpression.derivative`)
+    with respect to the string read so far. A state is tagged with the
+    numbers of the patterns that match, that is, whose derivatives
+    are nullable.
+
+    Attributes:
+        patterns: list of the patterns
+        start: the start state
+        dead: the state in which no pattern can match any more, if it
+          has been constructed
+    """
+    def __init__(self, es):
+        self.patterns = [str_to_regexp(e) if isinstance(e, str) else e for e in es]
+        self.states = []
+        self.index = {}
+        self.delta = []
+        self.tags = []
+        self.dead = None
+        self.start = self._add_state(tuple(self.patterns))
+
+    def _add_state(self, ds):
+        q = self.index.get(ds)
+        if q is None:
+            q = self.index[ds] = len(self.states)
+            self.states.append(ds)
+            self.delta.append({})
+            self.tags.append(tuple(i for i, d in enumerate(ds) if d.is_nullable()))
+            if all(d is EMPTYSET for d in ds):
+                self.dead = q
+        return q
+
+    def step(self, q, a):
+        """Return the state reached from state `q` by reading symbol `a`."""
+        try:
+            return self.delta[q][a]
+        except KeyError:
+            r = self.delta[q][a] = self._add_state(tuple(d.derivative(a) for d in self.states[q]))
+            return r
+
+    def matches(self, w):
+        """Returns the list of (numbers of) patterns that match string `w`.
+
+        Arguments:
+            w (String, str, or iterable of symbols): the string to test
+        """
+        if isinstance(w, str):
+            w = syntax.String(w)
+        q = self.start
+        for a in w:
+            q = self.step(q, a)
+            if q == self.dead:
+                return []
+        return list(self.tags[q])
+
+    def tokenize(self, w):
+        """Splits `w` into tokens, each matching one of the patterns,
+        like a lexical analyzer generated by lex.
+
+        Tokens are found from left to right. Each token is the longest
+        nonempty prefix of the rest of `w` that matches any pattern;
+        if it matches more than one, the lowest-numbered pattern wins.
+
+        Arguments:
+            w (String, str, or sequence of symbols): the string to split
+
+        Yields:
+            pairs (i, token) where i is the number of the pattern that
+            `token` (a `String`) matches.
+
+        Raises:
+            ValueError: if no pattern matches a nonempty prefix of
+            what remains of `w`.
+        """
+        if isinstance(w, str):
+            w = syntax.String(w)
+        w = list(w)
+        i = 0
+        while i < len(w):
+            q = self.start
+            best = None
+            for j in range(i, len(w)):
+                q = self.step(q, w[j])
+                if q == self.dead:
+                    break
+                if self.tags[q]:
+                    best = j+1, self.tags[q][0]
+            if best is None:
+                raise ValueError(f"no pattern matches at position {i}")
+            j, tag = best
+            yield tag, syntax.String(w[i:j])
+            i = j
 
 def fresh(s, alphabet):
     while s in alphabet:
@@ -279,67 +1196,109 @@ def fresh(s, alphabet):
 def to_regexp(m, display_steps=False):
     """Convert a finite automaton to a regular expression.
 
+    States are eliminated one at a time, as in Sipser (3e) Lemma 1.60,
+    choosing at each step the state whose elimination adds the least
+    to the total size of the edge labels (the heuristic of Han and
+    Wood, 2007), with ties broken by state name. Edge labels are
+    simplified (see `simplify`) as they are built.
+
     Arguments:
         m (Machine): the automaton to convert, which must be a finite automaton.
         display_steps (bool): if True and if run inside a Jupyter notebook,
           displays all steps of the conversion.
     """
-    def union_edge(q, r, e):
-        if g.has_edge(q, r):
-            g[q][r][0]['label'] = union([g[q][r][0]['label'], e])
-        else:
-            g.add_edge(q, r, {'label': e})
-
     if display_steps:
         from IPython.display import display, HTML
 
     if not m.is_finite():
         raise TypeError("machine must be a finite automaton")
 
-    states = sorted(m.states)
+    # out_edges[q][r] and in_edges[r][q] are the label of the edge from q to r
+    out_edges = {}
+    in_edges = {}
+    def union_edge(q, r, e):
+        if r in out_edges.setdefault(q, {}):
+            e = union([out_edges[q][r], e])
+        out_edges[q][r] = in_edges.setdefault(r, {})[q] = simplify(e)
+
+    def to_graph():
+        g = graphs.Graph({'rankdir': 'LR'})
+        g.add_node(start, {'start': True})
+        g.add_node(accept, {'accept': True})
+        for q in sorted(states):
+            g.add_node(q)
+        for q in out_edges:
+            for r, e in out_edges[q].items():
+                g.add_edge(q, r, {'label': e})
+        return g
 
-    g = graphs.Graph({'rankdir': 'LR'})
     for t in m.get_transitions():
         [[lstate], read] = t.lhs
         [[rstate]] = t.rhs
         union_edge(lstate, rstate, concatenation(symbol(x) for x in read))
 
     # Add new start and accept nodes
-    start = fresh('start', m.states)
-    g.add_node(start, {'start': True})
-    g.add_edge(start, m.get_start_state(), {'label': concatenation([])})
-    accept = fresh('accept', m.states)
-    g.add_node(accept, {'accept': True})
+    states = set(m.states) | {m.get_start_state()} | set(m.get_accept_states())
+    start = fresh('start', states)
+    union_edge(start, m.get_start_state(), concatenation([]))
+    accept = fresh('accept', states | {start})
     for q in m.get_accept_states():
-        g.add_edge(q, accept, {'label': concatenation([])})
+        union_edge(q, accept, concatenation([]))
 
     if display_steps:
-        display(g)
+        display(to_graph())
+
+    sizes = {}
+    def size(e):
+        def compute(x):
+            sizes[x] = 1 + sum(sizes[arg] for arg in x.args if x.op != 'symbol')
+        bottom_up(e, lambda x: x.args if x.op != 'symbol' else (), sizes.__contains__, compute)
+        return sizes[e]
 
-    while len(states) > 0:
-        s = states.pop()
+    def weight(s):
+        ins = [e for q, e in in_edges.get(s, {}).items() if q != s]
+        outs = [e for r, e in out_edges.get(s, {}).items() if r != s]
+        w = (sum(map(size, ins)) * (len(outs)-1) +
+             sum(map(size, outs)) * (len(ins)-1))
+        if s in out_edges.get(s, {}):
+            w += size(out_edges[s][s]) * (len(ins)*len(outs)-1)
+        return w
+
+    rank = {s: i for i, s in enumerate(sorted(states))}
+    weights = {s: weight(s) for s in states}
+    heap = [(w, rank[s], s) for s, w in weights.items()]
+    heapq.heapify(heap)
+
+    while heap:
+        w, _, s = heapq.heappop(heap)
+        if s not in states or weights[s] != w:
+            continue # stale entry
+        states.remove(s)
         if display_steps:
             display(HTML("eliminate " + s))
-        for q in states + [start]:
-            for r in states + [accept]:
-                try:
-                    inexpr = union(e['label'] for e in g.edges[q][s])
-                    outexpr = union(e['label'] for e in g.edges[s][r])
-                except KeyError:
-                    continue
-                if g.has_edge(s,s):
-                    loopexpr = union(e['label'] for e in g.edges[s][s])
-                    expr = concatenation([inexpr, star(loopexpr), outexpr])
-                else:
+
+        ins = in_edges.pop(s, {})
+        outs = out_edges.pop(s, {})
+        loop = outs.pop(s, None)
+        ins.pop(s, None)
+        for q in ins:
+            del out_edges[q][s]
+        for r in outs:
+            del in_edges[r][s]
+        for q, inexpr in ins.items():
+            for r, outexpr in outs.items():
+                if loop is None:
                     expr = concatenation([inexpr, outexpr])
+                else:
+                    expr = concatenation([inexpr, star(loop), outexpr])
                 union_edge(q, r, expr)
-        g.remove_node(s)
 
-        if display_steps:
-            display(g)
+        for q in set(ins) | set(outs):
+            if q in states:
+                weights[q] = weight(q)
+                heapq.heappush(heap, (weights[q], rank[q], q))
 
-    if g.has_edge(start, accept):
-        return g.edges[start][accept][0]['label']
-    else:
-        return union([])
+        if display_steps:
+            display(to_graph())
 
+    return out_edges.get(start, {}).get(accept, union([]))
@@ -5,9 +5,33 @@ import collections
 from . import machines
 from . import graphs
 
-__all__ = ['run', 'run_bfs', 'run_pda']
+__all__ = ['run', 'run_bfs', 'run_pda', 'run_lazy_dfa']
 
-def run(m, w, trace=False, steps=1000, show_stack=3):
+def index_transitions(m):
+    """Group the transitions of `m` by the state on their left-hand
+    side, so that a simulation only needs to try the transitions that
+    can apply to a configuration.
+
+    Returns:
+        A function mapping a Configuration to a list of transitions,
+        in the same order as `m.transitions`.
+    """
+    if m.state is None:
+        return lambda config: m.transitions
+    by_state = collections.defaultdict(list)
+    for t in m.transitions:
+        lhs = t.lhs[m.state]
+        if len(lhs) != 1 or lhs.position != 0:
+            return lambda config: m.transitions
+        by_state[lhs[0]].append(t)
+    def transitions(config):
+        store = config[m.state]
+        if len(store) != 1 or store.position != 0:
+            return m.transitions
+        return by_state.get(store[0], [])
+    return transitions
+
+def run(m, w, trace=False, steps=1000, show_stack=3, intern=False):
     """Runs machine `m` on string `w`, automatically selecting a search method.
 
     Arguments:
@@ -17,6 +41,7 @@ def run(m, w, trace=False, steps=1000, show_stack=3):
         trace (bool):     Print the steps of the simulation to stdout.
         steps (int):      Maximum number of steps to run the simulation.
         show_stack (int): For PDAs, the maximum depth of the stack to show.
+        intern (bool):    Share equal Stores and Configurations (see `machines.Interner`).
     
     Returns:
     
@@ -48,35 +73,38 @@ def run(m, w, trace=False, steps=1000, show_stack=3):
 
     if is_pda and stack is not None:
         if trace: print("using modified Lang algorithm")
-        return run_pda(m, w, stack=stack, trace=trace, show_stack=show_stack)
+        return run_pda(m, w, stack=stack, trace=trace, show_stack=show_stack, intern=intern)
     else:
         if trace: print("using breadth-first search")
-        return run_bfs(m, w, trace=trace, steps=steps)
+        return run_bfs(m, w, trace=trace, steps=steps, intern=intern)
 
-def run_bfs(m, w, trace=False, steps=1000):
+def run_bfs(m, w, trace=False, steps=1000, intern=False):
     """Runs machine `m` on string `w` using breadth-first search.
 
     Arguments:
 
-        m (Machine):  The machine to run.
-        w (String):   The string to run on.
-        trace (bool): Print the steps of the simulation to stdout.
-        steps (int):  Maximum number of steps to run the simulation.
+        m (Machine):   The machine to run.
+        w (String):    The string to run on.
+        trace (bool):  Print the steps of the simulation to stdout.
+        steps (int):   Maximum number of steps to run the simulation.
+        intern (bool): Share equal Stores and Configurations (see `machines.Interner`).
 
     Returns:
 
         Same as `run`.
     """
-    from .machines import Store, Configuration, Transition
+    from .machines import Store, Configuration, Transition, Interner
 
     agenda = collections.deque()
     chart = {}
+    canonical = Interner() if intern else lambda x: x
+    transitions = index_transitions(m)
 
     # Initial configuration
     config = list(m.start_config)
     w = Store(w)
     config[m.input] = w
-    config = Configuration(config)
+    config = canonical(Configuration(config))
 
     chart[config] = 0
     agenda.append(config)
@@ -98,10 +126,10 @@ def run_bfs(m, w, trace=False, steps=1000):
             run.add_node(tconfig, {'incomplete': True})
             continue
 
-        for rule in m.transitions:
+        for rule in transitions(tconfig):
             if trace: print("rule: {}".format(rule))
             if rule.match(tconfig):
-                nconfig = rule.apply(tconfig)
+                nconfig = canonical(rule.apply(tconfig))
 
                 if nconfig in chart:
                     assert chart[nconfig] <= chart[tconfig]+1
@@ -127,7 +155,66 @@ def run_bfs(m, w, trace=False, steps=1000):
 
     return run
 
-def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
+def run_lazy_dfa(m, w, trace=False, cache_size=10000):
+    """Runs a finite automaton `m` on string `w` by determinizing it on
+    the fly (see `operations.LazyDFA`). The run has exactly one path,
+    whose configurations have sets of states of `m` as their states.
+
+    Arguments:
+
+        m (Machine or LazyDFA): The finite automaton to run. To reuse
+                                the cache across many runs, pass a
+                                `LazyDFA`.
+        w (String):             The string to run on.
+        trace (bool):           Print the steps of the simulation to stdout.
+        cache_size (int):       Maximum number of DFA states to keep.
+
+    Returns:
+
+        Same as `run`.
+    """
+    from .machines import Store, Configuration, Transition
+    from .operations import LazyDFA
+
+    d = m if isinstance(m, LazyDFA) else LazyDFA(m, cache_size=cache_size)
+    w = Store(w)
+
+    run = graphs.Graph()
+    run.attrs['rankdir'] = 'LR'
+
+    def node(s, i):
+        return Configuration([[d.name(s)], Store(w.values[i:])])
+    def add_node(config, attrs):
+        attrs = dict(attrs)
+        attrs['rank'] = config[1]
+        attrs['label'] = Configuration(config[:1])
+        run.add_node(config, attrs)
+
+    s = d.start
+    config = node(s, 0)
+    add_node(config, {'start': True})
+    for i, a in enumerate(w):
+        if s == 0:
+            break
+        r = d.step(s, a)
+        nconfig = node(r, i+1)
+        if trace: print("{} → {}".format(config, nconfig))
+        add_node(nconfig, {})
+        run.add_edge(config, nconfig, {'transition': Transition([[d.name(s)], [a]], [[d.name(r)], []])})
+        s, config = r, nconfig
+    if d.is_accept(s) and config[1] == Store():
+        add_node(config, {'accept': True})
+
+    for i in range(len(w)+1):
+        r = 'rank{}'.format(i)
+        run.add_node(r, {'rank' : Store(w[i:]), 'style' : 'invisible'})
+        if i > 0:
+            run.add_edge(rprev, r, {'color': 'white', 'label' : w[i-1]})
+        rprev = r
+
+    return run
+
+def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False, intern=False):
     """Runs a nondeterministic pushdown automaton using a cubic-time
     algorithm based on: Bernard Lang, "Deterministic techniques for
     efficient non-deterministic parsers." doi:10.1007/3-540-06841-4_65
@@ -140,6 +227,7 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
         trace (bool):      Print the steps of the simulation to stdout.
         show_stack (int):  The maximum depth of the stack to show.
         keep_nodes (bool): Keep all nodes that aren't PDA configurations
+        intern (bool):     Share equal Stores and Configurations (see `machines.Interner`).
 
     Returns:
 
@@ -184,12 +272,14 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
 
     """
 
-    from .machines import Store, Configuration, Transition
+    from .machines import Store, Configuration, Transition, Interner
 
     agenda = collections.deque()
     chart = set()
+    canonical = Interner() if intern else lambda x: x
     index_left = collections.defaultdict(set)
     index_right = collections.defaultdict(set)
+    transitions = index_transitions(m)
     run = graphs.Graph()
     run.attrs['rankdir'] = 'LR'
 
@@ -208,7 +298,7 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
                 stores.append(Store(config[si][:-1], config[si].position))
             else:
                 stores.append(config[si])
-        return Configuration(stores)
+        return canonical(Configuration(stores))
     
     def push(config, x):
         stores = []
@@ -217,13 +307,13 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
                 stores.append(Store(config[si].values+(x,), config[si].position))
             else:
                 stores.append(config[si])
-        return Configuration(stores)
+        return canonical(Configuration(stores))
 
     # Axiom
     config = list(m.start_config)
     w = Store(w)
     config[m.input] = w
-    config = Configuration(config)
+    config = canonical(Configuration(config))
 
     # draw input symbols
     for i in range(len(w)+1):
@@ -239,7 +329,7 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
         if parent is not None:
             child = list(child)
             child[stack] = Store(child[stack].values + (f'…{hash(parent)}',), child[stack].position)
-        return Configuration(child)
+        return canonical(Configuration(child))
 
     def add_node(parent, child, attrs=None):
         node = get_node(parent, child)
@@ -301,9 +391,9 @@ def run_pda(m, w, stack=2, trace=False, show_stack=3, keep_nodes=False):
 
         # The stack is just right (Apply)
         else:
-            for transition in m.transitions:
+            for transition in transitions(child):
                 if transition.match(child):
-                    sister = transition.apply(child)
+                    sister = canonical(transition.apply(child))
                     add(parent, sister, parent, child, transition=transition)
 
     # Remove any edges that don't have transitions
@@ -35,6 +35,7 @@ def repr_html(x):
 symbol_re = re.compile(r"\|-|-\||[⊢⊣#$¢␣]|[A-Za-z0-9_.']+")
 symbol_mappings = {'|-': '⊢', '-|': '⊣', '_': '␣'}
 class Symbol(str):
+    __slots__ = ('__weakref__',)
     def __new__(cls, s):
         s = symbol_mappings.get(s, s)
         return str.__new__(cls, s)
@@ -50,6 +51,7 @@ operator_mappings = {
     '|': '∪'
 }
 class Operator(str):
+    __slots__ = ()
     def __new__(cls, s):
         s = operator_mappings.get(s, s)
         return str.__new__(cls, s)
@@ -246,11 +248,79 @@ def str_to_transition(s):
 
 ### Data structures that print more like in math books
 
-@dataclasses.dataclass(frozen=True, order=True)
-class String:
+class Frozen:
+    """Base class for immutable values that are used heavily as dict keys
+    and set members (`String`, `Store`, `Configuration`, `Transition`).
+
+    Subclasses store their fields in `__slots__` and return them from
+    `_key`, which determines equality and ordering (as with a frozen
+    dataclass with `order=True`). The hash is computed on first use
+    and cached. As with a dataclass, the repr shows the fields by
+    name: the public slots, base classes first, in the order of `_key`.
+    """
+
+    __slots__ = ('_hash', '__weakref__')
+
+    def _key(self):
+        """Tuple of fields used for equality, ordering, and hashing."""
+        raise NotImplementedError()
+
+    def _args(self):
+        """Tuple of arguments that reconstruct self."""
+        return self._key()
+
+    def __setattr__(self, name, value):
+        raise dataclasses.FrozenInstanceError(f"cannot assign to field '{name}'")
+    def __delattr__(self, name):
+        raise dataclasses.FrozenInstanceError(f"cannot delete field '{name}'")
+
+    def __reduce__(self):
+        return (self.__class__, self._args())
+
+    def __repr__(self):
+        fields = [name
+                  for cls in reversed(self.__class__.__mro__)
+                  for name in cls.__dict__.get('__slots__', ())
+                  if not name.startswith('_')]
+        return '{}({})'.format(self.__class__.__name__,
+                               ', '.join('{}={!r}'.format(name, value) for name, value in zip(fields, self._key())))
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            h = hash(self._key())
+            object.__setattr__(self, '_hash', h)
+            return h
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __lt__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() < other._key()
+    def __le__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() <= other._key()
+    def __gt__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() > other._key()
+    def __ge__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() >= other._key()
+
+class String(Frozen):
     """A sequence of `Symbols` (not to be confused with `str`)."""
 
-    values: tuple #: A sequence of Symbols
+    __slots__ = {'values': 'A sequence of Symbols'}
     
     def __init__(self, values=None):
         if values is None:
@@ -258,9 +328,12 @@ class String:
         elif isinstance(values, str):
             values = tuple(str_to_string(values))
         else:
-            values = tuple(Symbol(x) for x in values)
+            values = tuple(x if type(x) is Symbol else Symbol(x) for x in values)
         object.__setattr__(self, 'values', values)
 
+    def _key(self):
+        return (self.values,)
+
     def __len__(self):
         return len(self.values)
     def __getitem__(self, i):